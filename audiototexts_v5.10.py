@@ -11,28 +11,2566 @@
 # 5. 修復 ffprobe 問題
 # ==========================================
 
-import whisper
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import os
 import sys
 import threading
 import subprocess
 import gc
-import torch
+import importlib
+import importlib.util
 import queue
-import time
 import re
+import json
+import shutil
+import logging
+import logging.handlers
+import zlib
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import timedelta
 from tkinter import *
 from tkinter import filedialog, messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 
-# 嘗試載入 pydub（可選）
-PYDUB_AVAILABLE = False
-try:
-    from pydub import AudioSegment
-    PYDUB_AVAILABLE = True
-except ImportError:
-    pass
+# ==========================================
+# 延遲匯入（啟動時不載入 whisper、torch 等大型模組）
+# ==========================================
+
+# 各模組第一次匯入的耗時（秒），供啟動效能檢查
+IMPORT_TIMES = {}
+
+
+def timed_import(name):
+    """匯入模組並記錄第一次匯入的耗時"""
+    already_loaded = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if not already_loaded:
+        IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+class LazyModule:
+    """模組代理：第一次存取屬性時才匯入"""
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return getattr(self._module, attr)
+
+
+whisper = LazyModule("whisper")
+torch = LazyModule("torch")
+av = LazyModule("av")
+psutil = LazyModule("psutil")
+
+# 可選套件只檢查是否安裝；PyAV 於背景實際匯入後再確認
+PYAV_AVAILABLE = importlib.util.find_spec("av") is not None
+SAFETENSORS_AVAILABLE = importlib.util.find_spec("safetensors") is not None
+PSUTIL_AVAILABLE = importlib.util.find_spec("psutil") is not None
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# 使用者快取資料夾：Windows 為 %LOCALAPPDATA%\audiototexts，其他系統為 ~/.cache/audiototexts（依 XDG_CACHE_HOME）
+USER_CACHE_DIR = os.path.join(os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+                              or os.path.join(os.path.expanduser("~"), ".cache"), "audiototexts")
+
+
+def run_startup_benchmark():
+    """逐一匯入大型模組並列出耗時（python audiototexts_v5.10.py --startup-benchmark）"""
+    print(f"模組載入完成：{time.perf_counter() - _STARTUP_T0:.3f} 秒")
+    for name in ("torch", "whisper", "av", "psutil", "safetensors"):
+        if importlib.util.find_spec(name) is None:
+            print(f"  {name:<12} 未安裝")
+            continue
+        try:
+            timed_import(name)
+        except ImportError as e:
+            print(f"  {name:<12} 匯入失敗：{e}")
+    for name, seconds in sorted(IMPORT_TIMES.items(), key=lambda item: -item[1]):
+        print(f"  {name:<12} {seconds:.3f} 秒")
+    
+    if "torch" in sys.modules:
+        start = time.perf_counter()
+        available = torch.cuda.is_available()
+        print(f"  {'CUDA 檢查':<10} {time.perf_counter() - start:.3f} 秒（{'可用' if available else '不可用'}）")
+    print(f"合計：{time.perf_counter() - _STARTUP_T0:.3f} 秒")
+
+
+# ==========================================
+# 片段儲存（欄位式）
+# ==========================================
+
+def _ranges_to_indices(ranges):
+    """將多個 [起, 迄) 區間展開為連續的索引陣列"""
+    if len(ranges) == 0:
+        return np.zeros(0, dtype=np.int64)
+    counts = ranges[:, 1] - ranges[:, 0]
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    # 每個區間的起點減去其在結果中的位置，再加上連續遞增值
+    positions = np.cumsum(counts) - counts
+    return np.repeat(ranges[:, 0] - positions, counts) + np.arange(total)
+
+
+class SegmentStore:
+    """以欄位方式儲存片段：數值欄位為 NumPy 陣列，文字集中於單一緩衝區並以位移索引"""
+    
+    FLOAT_COLUMNS = ("start", "end", "avg_logprob", "no_speech_prob", "compression_ratio",
+                     "unclear_mask", "retry_attempts", "retry_seconds", "retry_strategy")
+    DEFAULTS = {"avg_logprob": 0.0, "no_speech_prob": 0.0, "compression_ratio": 1.0,
+                "unclear_mask": 0.0, "retry_attempts": 0.0, "retry_seconds": 0.0, "retry_strategy": -1.0}
+    TEXT_KEY = "text"
+    HAS_WORDS = True
+    
+    def __init__(self, capacity=64):
+        self._size = 0
+        self._capacity = max(1, capacity)
+        self._columns = {name: np.zeros(self._capacity, dtype=np.float64) for name in self.FLOAT_COLUMNS}
+        self._text_offsets = np.zeros((self._capacity, 2), dtype=np.int64)
+        self._text_pieces = []
+        self._text_length = 0
+        self._text_buffer = ""
+        
+        # 字詞時間戳記（每個片段對應 words 中的 [起, 迄) 區間）
+        if self.HAS_WORDS:
+            self._word_ranges = np.zeros((self._capacity, 2), dtype=np.int64)
+            self.words = WordStore()
+        else:
+            self._word_ranges = None
+            self.words = None
+    
+    @classmethod
+    def from_segments(cls, segments, offset=0.0):
+        """由 Whisper 的片段 dict 清單建立"""
+        store = cls(capacity=len(segments))
+        store.extend(segments, offset)
+        return store
+    
+    def __len__(self):
+        return self._size
+    
+    def __getitem__(self, index):
+        return self.row(index)
+    
+    def __iter__(self):
+        for i in range(self._size):
+            yield self.row(i)
+    
+    def __getattr__(self, name):
+        # 數值欄位以屬性方式存取，例如 store.start、store.avg_logprob
+        if not name.startswith('_') and name in self.FLOAT_COLUMNS:
+            return self._columns[name][:self._size]
+        raise AttributeError(name)
+    
+    def _grow(self, needed):
+        """容量不足時倍增"""
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2)
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+        
+        grown = np.zeros((capacity, 2), dtype=np.int64)
+        grown[:self._size] = self._text_offsets[:self._size]
+        self._text_offsets = grown
+        
+        if self.HAS_WORDS:
+            grown = np.zeros((capacity, 2), dtype=np.int64)
+            grown[:self._size] = self._word_ranges[:self._size]
+            self._word_ranges = grown
+        
+        self._capacity = capacity
+    
+    def _append_text(self, text):
+        """將文字附加到緩衝區，回傳 (起, 迄) 位移"""
+        start = self._text_length
+        self._text_pieces.append(text)
+        self._text_length += len(text)
+        return start, self._text_length
+    
+    def _buffer(self):
+        """取得合併後的文字緩衝區（有新文字時才重新合併）"""
+        if len(self._text_pieces) > 1 or (self._text_pieces and self._text_pieces[0] is not self._text_buffer):
+            self._text_buffer = "".join(self._text_pieces)
+            self._text_pieces = [self._text_buffer]
+        return self._text_buffer
+    
+    def _index(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        return index
+    
+    def append(self, start, end, text, words=None, **metrics):
+        """新增一個片段，回傳其索引"""
+        i = self._size
+        self._grow(i + 1)
+        
+        self._columns["start"][i] = start
+        self._columns["end"][i] = end
+        for name in self.FLOAT_COLUMNS[2:]:
+            value = metrics.get(name)
+            self._columns[name][i] = self.DEFAULTS[name] if value is None else value
+        self._text_offsets[i] = self._append_text(text)
+        
+        if self.HAS_WORDS:
+            self._word_ranges[i] = self.words.extend(words or [])
+        
+        self._size += 1
+        return i
+    
+    def append_dict(self, segment, offset=0.0):
+        """由 Whisper 片段 dict 新增，時間戳加上 offset 秒"""
+        metrics = {name: segment.get(name) for name in self.FLOAT_COLUMNS[2:]}
+        words = segment.get("words")
+        if words and offset:
+            words = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in words]
+        return self.append(segment["start"] + offset, segment["end"] + offset,
+                           segment.get(self.TEXT_KEY, "").strip(), words=words, **metrics)
+    
+    def extend(self, segments, offset=0.0):
+        """批次新增，回傳新增範圍 (起, 迄)"""
+        first = self._size
+        self._grow(first + len(segments))
+        for segment in segments:
+            self.append_dict(segment, offset)
+        return first, self._size
+    
+    def extend_store(self, other):
+        """附加另一個儲存的所有片段（整塊複製欄位與文字緩衝區）"""
+        first = self._size
+        n = len(other)
+        self._grow(first + n)
+        for name in self.FLOAT_COLUMNS:
+            self._columns[name][first:first + n] = other._columns[name][:n]
+        
+        text_base = self._text_length
+        other_buffer = other._buffer()
+        self._text_pieces.append(other_buffer)
+        self._text_length += len(other_buffer)
+        self._text_offsets[first:first + n] = other._text_offsets[:n] + text_base
+        
+        if self.HAS_WORDS:
+            word_base = len(self.words)
+            self.words.extend_store(other.words)
+            self._word_ranges[first:first + n] = other._word_ranges[:n] + word_base
+        
+        self._size += n
+    
+    def text(self, index):
+        """取得片段文字"""
+        index = self._index(index)
+        start, end = self._text_offsets[index]
+        return self._buffer()[start:end]
+    
+    def texts(self, first=0, last=None):
+        """取得所有片段文字（可指定 [first, last) 範圍）"""
+        last = self._size if last is None else min(last, self._size)
+        buffer = self._buffer()
+        return [buffer[start:end] for start, end in self._text_offsets[first:last].tolist()]
+    
+    def full_text(self):
+        """以空白連接所有非空白片段"""
+        return " ".join(t for t in self.texts() if t)
+    
+    def row_words(self, index):
+        """取得片段的字詞時間戳記"""
+        if not self.HAS_WORDS:
+            return []
+        start, end = self._word_ranges[self._index(index)]
+        return [self.words.row(j) for j in range(start, end)]
+    
+    def row_word_store(self):
+        """依片段順序取出各片段自己的字詞（不含 update() 取代片段後遺留在 words 中的舊字詞）"""
+        if not self.HAS_WORDS:
+            return None
+        return self.words.select(_ranges_to_indices(self._word_ranges[:self._size]))
+    
+    def row(self, index):
+        """以 dict 形式取得單一片段"""
+        index = self._index(index)
+        row = {name: float(self._columns[name][index]) for name in self.FLOAT_COLUMNS}
+        row[self.TEXT_KEY] = self.text(index)
+        if self.HAS_WORDS:
+            start, end = self._word_ranges[index]
+            if end > start:
+                row["words"] = self.row_words(index)
+        return row
+    
+    def set_times(self, index, start, end):
+        """修改片段起訖時間"""
+        index = self._index(index)
+        self._columns["start"][index] = start
+        self._columns["end"][index] = end
+    
+    def set_text(self, index, text):
+        """只修改片段文字"""
+        self._text_offsets[self._index(index)] = self._append_text(text)
+    
+    def keep_text_spans(self, index, spans):
+        """只保留片段文字中 spans（[起, 迄) 字元位置）的部分，字詞與起訖時間一併裁切
+        
+        字詞依序串接即為片段文字，以每個字詞中點所在的字元位置判斷是否保留；
+        有保留的字詞時，起訖時間改為第一個與最後一個保留字詞的時間。
+        """
+        index = self._index(index)
+        text = self.text(index)
+        self.set_text(index, re.sub(r'\s{2,}', ' ', "".join(text[a:b] for a, b in spans)).strip())
+        if not self.HAS_WORDS:
+            return
+        
+        first, last = self._word_ranges[index].tolist()
+        if last <= first:
+            return
+        starts, ends = self._word_char_positions(index, len(text))
+        centres = (starts + ends) / 2
+        
+        keep = np.zeros(last - first, dtype=bool)
+        for a, b in spans:
+            keep |= (centres >= a) & (centres < b)
+        kept = np.flatnonzero(keep) + first
+        
+        if len(kept) == 0:
+            self._word_ranges[index] = (first, first)
+            return
+        if kept[-1] - kept[0] + 1 == len(kept):
+            self._word_ranges[index] = (kept[0], kept[-1] + 1)
+        else:
+            # 不連續時複製到字詞儲存尾端，原字詞成為遺留資料（輸出時依列的範圍取用）
+            base = len(self.words)
+            self.words.extend_store(self.words.select(kept))
+            self._word_ranges[index] = (base, len(self.words))
+        self.set_times(index, self.words.start[kept[0]], self.words.end[kept[-1]])
+    
+    def _word_char_positions(self, index, text_length):
+        """各字詞在片段文字中的 [起, 迄) 字元位置（字詞依序串接即為片段文字）"""
+        first, last = self._word_ranges[index].tolist()
+        word_texts = self.words.texts(first, last)
+        joined = "".join(word_texts)
+        lead = len(joined) - len(joined.lstrip())
+        lengths = np.fromiter(map(len, word_texts), dtype=np.float64, count=len(word_texts))
+        ends = np.cumsum(lengths) - lead
+        starts = ends - lengths
+        # 字詞與片段文字長度不一致時（例如合併過的片段）依比例對應
+        total = len(joined) - lead
+        if total > 0 and total != text_length:
+            starts *= text_length / total
+            ends *= text_length / total
+        return starts, ends
+    
+    def char_times(self, index, positions):
+        """估計片段文字中各字元位置的時間：有字詞時間戳時取所在字詞的中點，否則依位置比例換算"""
+        index = self._index(index)
+        positions = np.asarray(positions, dtype=np.float64)
+        length = len(self.text(index))
+        if self.HAS_WORDS:
+            first, last = self._word_ranges[index].tolist()
+            if last > first:
+                _, ends = self._word_char_positions(index, length)
+                owner = np.minimum(np.searchsorted(ends, positions, side='right'), last - first - 1)
+                return (self.words.start[first:last][owner] + self.words.end[first:last][owner]) / 2
+        
+        start, end = self._columns["start"][index], self._columns["end"][index]
+        return start + (end - start) * positions / max(length, 1)
+    
+    def keep_time_range(self, index, start=-np.inf, end=np.inf):
+        """只保留片段中時間落在 [start, end) 的詞，以詞為單位裁切，回傳是否仍有文字"""
+        index = self._index(index)
+        text = self.text(index)
+        spans = [(m.start(), m.end()) for m in TOKEN_RE.finditer(text)]
+        if not spans:
+            return bool(text.strip())
+        
+        positions = np.array(spans, dtype=np.float64)
+        times = self.char_times(index, positions.mean(axis=1))
+        inside = np.flatnonzero((times >= start) & (times < end))
+        if len(inside) == len(spans):
+            return True
+        if len(inside) == 0:
+            self.keep_text_spans(index, [])
+            return False
+        
+        has_words = bool(self.row_words(index))
+        kept_start, kept_end = spans[inside[0]][0], spans[inside[-1]][1]
+        if not has_words:
+            # 沒有字詞時間戳時，起訖時間依保留部分的字元位置估計
+            self.set_times(index, *self.char_times(index, [kept_start, kept_end]))
+        self.keep_text_spans(index, [(kept_start, kept_end)])
+        return True
+    
+    def set_column(self, name, indices, values):
+        """修改指定片段的數值欄位"""
+        self._columns[name][:self._size][indices] = values
+    
+    def update(self, index, segment):
+        """以新結果取代片段內容（未提供的時間戳維持原值）"""
+        index = self._index(index)
+        for name in self.FLOAT_COLUMNS:
+            if segment.get(name) is not None:
+                self._columns[name][index] = segment[name]
+        self._text_offsets[index] = self._append_text(segment.get(self.TEXT_KEY, "").strip())
+        if self.HAS_WORDS:
+            self._word_ranges[index] = self.words.extend(segment.get("words") or [])
+    
+    def _build(self, columns, texts, word_indices=None, word_counts=None):
+        """由欄位與文字清單建立新的緊湊儲存"""
+        store = type(self)(capacity=len(texts))
+        n = len(texts)
+        for name in self.FLOAT_COLUMNS:
+            store._columns[name][:n] = columns[name]
+        
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+        ends = np.cumsum(lengths)
+        store._text_offsets[:n, 0] = ends - lengths
+        store._text_offsets[:n, 1] = ends
+        store._text_buffer = "".join(texts)
+        store._text_pieces = [store._text_buffer]
+        store._text_length = int(ends[-1]) if n else 0
+        
+        if self.HAS_WORDS and word_indices is not None and len(word_indices) > 0:
+            store.words = self.words.select(word_indices)
+            word_ends = np.cumsum(word_counts)
+            store._word_ranges[:n, 0] = word_ends - word_counts
+            store._word_ranges[:n, 1] = word_ends
+        
+        store._size = n
+        return store
+    
+    def select(self, indices):
+        """依索引或布林遮罩挑選片段，回傳新的緊湊儲存"""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        
+        columns = {name: self._columns[name][:self._size][indices] for name in self.FLOAT_COLUMNS}
+        texts = self.texts()
+        selected_texts = [texts[i] for i in indices.tolist()]
+        
+        word_indices = word_counts = None
+        if self.HAS_WORDS:
+            ranges = self._word_ranges[:self._size][indices]
+            word_indices = _ranges_to_indices(ranges)
+            word_counts = ranges[:, 1] - ranges[:, 0]
+        
+        return self._build(columns, selected_texts, word_indices, word_counts)
+    
+    def merge_groups(self, group_ids):
+        """合併相鄰且群組編號相同的片段（沿用第一個片段的指標，結束時間取最後一個）"""
+        group_ids = np.asarray(group_ids)
+        if self._size == 0:
+            return self
+        
+        boundaries = np.flatnonzero(np.diff(group_ids)) + 1
+        firsts = np.concatenate(([0], boundaries))
+        lasts = np.concatenate((boundaries - 1, [self._size - 1]))
+        
+        columns = {name: self._columns[name][:self._size][firsts] for name in self.FLOAT_COLUMNS}
+        columns["end"] = self._columns["end"][:self._size][lasts]
+        
+        texts = self.texts()
+        merged_texts = [" ".join(texts[a:b + 1]) for a, b in zip(firsts.tolist(), lasts.tolist())]
+        
+        word_indices = word_counts = None
+        if self.HAS_WORDS:
+            ranges = self._word_ranges[:self._size]
+            word_indices = _ranges_to_indices(ranges)
+            word_counts = np.add.reduceat(ranges[:, 1] - ranges[:, 0], firsts)
+        
+        return self._build(columns, merged_texts, word_indices, word_counts)
+
+
+class WordStore(SegmentStore):
+    """字詞時間戳記的欄位式儲存"""
+    
+    FLOAT_COLUMNS = ("start", "end", "probability")
+    DEFAULTS = {"probability": 0.0}
+    TEXT_KEY = "word"
+    HAS_WORDS = False
+    
+    def append_dict(self, segment, offset=0.0):
+        # 字詞保留前導空白（英文斷詞需要）
+        return self.append(segment["start"] + offset, segment["end"] + offset,
+                           segment.get(self.TEXT_KEY, ""), probability=segment.get("probability"))
+
+
+# ==========================================
+# 語意不明偵測（批次評分）
+# ==========================================
+
+# 語意不明原因（位元遮罩）
+UNCLEAR_LOW_CONFIDENCE = 1 << 0
+UNCLEAR_NO_SPEECH = 1 << 1
+UNCLEAR_HIGH_COMPRESSION = 1 << 2
+UNCLEAR_TEXT_PATTERN = 1 << 3
+UNCLEAR_UNNATURAL_MIXING = 1 << 4
+UNCLEAR_TOO_SHORT = 1 << 5
+
+# 機器可讀輸出使用的原因代碼
+UNCLEAR_REASON_KEYS = (
+    (UNCLEAR_LOW_CONFIDENCE, "low_confidence"),
+    (UNCLEAR_NO_SPEECH, "no_speech"),
+    (UNCLEAR_HIGH_COMPRESSION, "high_compression"),
+    (UNCLEAR_TEXT_PATTERN, "text_pattern"),
+    (UNCLEAR_UNNATURAL_MIXING, "unnatural_mixing"),
+    (UNCLEAR_TOO_SHORT, "too_short"),
+)
+
+# 語意不明的判斷模式
+UNCLEAR_PATTERNS = [
+    # 中日文不自然混合（日文語法 + 簡體中文）
+    r'[ぁ-んァ-ン][们这那什么怎样][ぁ-んァ-ン]',
+    # 重複字元過多
+    r'(?P<rep>.)(?P=rep){4,}',
+    # 奇怪的標點組合
+    r'[。、]{3,}',
+    # 純數字或符號（可能是亂碼）
+    r'^[\d\s\.\,\-]+$',
+    # 日文助詞後接簡體中文
+    r'[はがをにでと][们这那什]',
+]
+
+# 合併成單一預先編譯的正規表示式，每段文字只掃描一次
+UNCLEAR_REGEX = re.compile('|'.join(f'(?:{p})' for p in UNCLEAR_PATTERNS))
+
+# 比對重複內容時移除的非文字字元
+NON_WORD_RE = re.compile(r'[^\w]')
+
+# ==========================================
+# 文字系統分類（中日文混合偵測、語言統計）
+# ==========================================
+
+# 簡體中文特有字與對應的繁體字（排除日文常用漢字也會使用的字，如「写」「机」）
+SIMPLIFIED_TRADITIONAL_PAIRS = (
+    "这這们們么麼说說对對为為让讓给給该該时時还還样樣发發问問经經现現"
+    "实實东東开開见見觉覺应應长長头頭动動话話电電进進吗嗎个個过過难難"
+    "讲講谢謝请請钱錢买買卖賣车車门門间間题題认認识識词詞语語读讀"
+    "听聽从從业業亲親书書员員两兩几幾华華网網边邊处處总總"
+)
+SIMPLIFIED_ONLY_CHARS = SIMPLIFIED_TRADITIONAL_PAIRS[0::2]
+TRADITIONAL_ONLY_CHARS = SIMPLIFIED_TRADITIONAL_PAIRS[1::2]
+
+
+class ScriptClassifier:
+    """以預先建立的碼位對照表，單次掃描統計各文字系統的字數"""
+    
+    OTHER = 0
+    KANA = 1
+    SIMPLIFIED = 2
+    TRADITIONAL = 3
+    HAN = 4
+    LATIN = 5
+    NUM_SCRIPTS = 6
+    
+    def __init__(self):
+        table = np.zeros(0x10000, dtype=np.uint8)
+        
+        # 漢字（簡繁共用）
+        table[0x3400:0x4DC0] = self.HAN
+        table[0x4E00:0xA000] = self.HAN
+        table[0xF900:0xFB00] = self.HAN
+        
+        # 日文假名（不含「・」「ー」等符號）
+        table[0x3041:0x3097] = self.KANA
+        table[0x30A1:0x30FB] = self.KANA
+        table[0x30FD:0x3100] = self.KANA
+        table[0x31F0:0x3200] = self.KANA
+        table[0xFF66:0xFF9E] = self.KANA
+        
+        # 拉丁字母（含全形與帶重音字母）
+        table[ord('A'):ord('Z') + 1] = self.LATIN
+        table[ord('a'):ord('z') + 1] = self.LATIN
+        table[0x00C0:0x0250] = self.LATIN
+        table[0x00D7] = self.OTHER
+        table[0x00F7] = self.OTHER
+        table[0xFF21:0xFF3B] = self.LATIN
+        table[0xFF41:0xFF5B] = self.LATIN
+        
+        # 簡體／繁體特有字
+        table[[ord(c) for c in SIMPLIFIED_ONLY_CHARS]] = self.SIMPLIFIED
+        table[[ord(c) for c in TRADITIONAL_ONLY_CHARS]] = self.TRADITIONAL
+        
+        self.table = table
+    
+    def _categories(self, text):
+        """回傳每個字元的文字系統代碼"""
+        codepoints = np.frombuffer(text.encode('utf-32-le', errors='replace'), dtype=np.uint32)
+        categories = self.table[np.minimum(codepoints, 0xFFFF)]
+        # 擴充區漢字（CJK Ext. B 之後）
+        categories[(codepoints >= 0x20000) & (codepoints < 0x40000)] = self.HAN
+        return categories
+    
+    def classify(self, text):
+        """統計單段文字各文字系統的字數"""
+        return np.bincount(self._categories(text), minlength=self.NUM_SCRIPTS)
+    
+    def classify_many(self, texts):
+        """一次統計多段文字，回傳 (片段數, 文字系統數) 的計數陣列"""
+        n = len(texts)
+        if n == 0:
+            return np.zeros((0, self.NUM_SCRIPTS), dtype=np.int64)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+        categories = self._categories(''.join(texts))
+        segment_ids = np.repeat(np.arange(n), lengths)
+        counts = np.bincount(segment_ids * self.NUM_SCRIPTS + categories,
+                             minlength=n * self.NUM_SCRIPTS)
+        return counts.reshape(n, self.NUM_SCRIPTS)
+    
+    def format_counts(self, counts):
+        """格式化文字組成統計"""
+        return (f"假名 {counts[self.KANA]}／簡體 {counts[self.SIMPLIFIED]}／"
+                f"繁體 {counts[self.TRADITIONAL]}／其他漢字 {counts[self.HAN]}／"
+                f"拉丁字母 {counts[self.LATIN]}")
+
+
+# 程式啟動時建立一次，供所有片段共用
+SCRIPT_CLASSIFIER = ScriptClassifier()
+
+
+def has_unnatural_mixing(text):
+    """檢測中日文是否不自然混合"""
+    counts = SCRIPT_CLASSIFIER.classify(text)
+    # 如果同時有假名和簡體中文特有字，很可能是錯誤
+    return bool(counts[ScriptClassifier.KANA] and counts[ScriptClassifier.SIMPLIFIED])
+
+
+def score_unclear_segments(segments, confidence_threshold):
+    """批次判斷整份片段清單，回傳每個片段的語意不明原因位元遮罩"""
+    if not isinstance(segments, SegmentStore):
+        segments = SegmentStore.from_segments(segments)
+    
+    n = len(segments)
+    masks = np.zeros(n, dtype=np.uint8)
+    if n == 0:
+        return masks
+    
+    texts = segments.texts()
+    avg_logprob = segments.avg_logprob
+    no_speech_prob = segments.no_speech_prob
+    compression_ratio = segments.compression_ratio
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    
+    # 1. 信心度過低
+    masks[avg_logprob < confidence_threshold] |= UNCLEAR_LOW_CONFIDENCE
+    # 2. 靜音機率過高
+    masks[no_speech_prob > 0.7] |= UNCLEAR_NO_SPEECH
+    # 3. 壓縮比異常（可能是重複/幻覺）
+    masks[compression_ratio > 2.5] |= UNCLEAR_HIGH_COMPRESSION
+    
+    # 4. 文字模式異常
+    search = UNCLEAR_REGEX.search
+    pattern_hits = np.fromiter((search(t) is not None for t in texts), dtype=bool, count=n)
+    masks[pattern_hits] |= UNCLEAR_TEXT_PATTERN
+    
+    # 5. 中日文不自然混合檢測
+    script_counts = SCRIPT_CLASSIFIER.classify_many(texts)
+    mixing = (script_counts[:, ScriptClassifier.KANA] > 0) & (script_counts[:, ScriptClassifier.SIMPLIFIED] > 0)
+    masks[mixing] |= UNCLEAR_UNNATURAL_MIXING
+    
+    # 6. 太短且信心度不高
+    masks[(lengths < 3) & (avg_logprob < -0.5)] |= UNCLEAR_TOO_SHORT
+    
+    return masks
+
+
+def describe_unclear_reasons(mask, segment):
+    """將位元遮罩轉為可讀的原因清單"""
+    reasons = []
+    if mask & UNCLEAR_LOW_CONFIDENCE:
+        reasons.append(f"信心度低({segment.get('avg_logprob', 0):.2f})")
+    if mask & UNCLEAR_NO_SPEECH:
+        reasons.append(f"可能是靜音({segment.get('no_speech_prob', 0):.2f})")
+    if mask & UNCLEAR_HIGH_COMPRESSION:
+        reasons.append(f"壓縮比高({segment.get('compression_ratio', 1):.2f})")
+    if mask & UNCLEAR_TEXT_PATTERN:
+        reasons.append("文字模式異常")
+    if mask & UNCLEAR_UNNATURAL_MIXING:
+        reasons.append("中日混合不自然")
+    if mask & UNCLEAR_TOO_SHORT:
+        reasons.append("內容過短")
+    return reasons
+
+
+def count_unclear_reasons(mask):
+    """計算遮罩中的原因數量"""
+    return bin(int(mask)).count('1')
+
+
+# ==========================================
+# 重複循環偵測（跨片段）
+# ==========================================
+
+# 斷詞：英數字以單字為單位，其他文字（中日文等）逐字
+TOKEN_RE = re.compile(r'[0-9a-z]+|[^\W\d_a-z]', re.IGNORECASE)
+
+
+def tokenize_segments(texts):
+    """將所有片段斷詞，回傳 (詞代碼, 所屬片段, 起始字元位置, 結束字元位置) 陣列"""
+    vocabulary = {}
+    ids = []
+    owners = []
+    starts = []
+    ends = []
+    
+    for index, text in enumerate(texts):
+        for match in TOKEN_RE.finditer(text):
+            ids.append(vocabulary.setdefault(match.group().lower(), len(vocabulary)))
+            owners.append(index)
+            starts.append(match.start())
+            ends.append(match.end())
+    
+    return (np.array(ids, dtype=np.int64), np.array(owners, dtype=np.int64),
+            np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64))
+
+
+def find_repetition_loops(token_ids, max_period=200, min_repeats=3, min_tokens=15):
+    """找出連續重複的詞序列（幻覺循環），回傳應移除的詞遮罩
+    
+    對每個週期 p 以向量化方式比較 token[i] 與 token[i+p]，連續相等的長度
+    達到 (min_repeats - 1) * p 即表示該段以週期 p 重複 min_repeats 次以上。
+    每個循環只保留第一份，總成本為 O(n * max_period)。
+    """
+    n = len(token_ids)
+    remove = np.zeros(n, dtype=bool)
+    
+    for period in range(1, min(max_period, n // min_repeats) + 1):
+        equal = token_ids[:-period] == token_ids[period:]
+        if not equal.any():
+            continue
+        
+        # 找出連續相等的區段 [run_start, run_end)
+        padded = np.concatenate(([False], equal, [False]))
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        run_starts = edges[0::2]
+        run_lengths = edges[1::2] - run_starts
+        
+        copies = (run_lengths + period) // period
+        qualified = (copies >= min_repeats) & (copies * period >= min_tokens)
+        
+        for run_start, count in zip(run_starts[qualified].tolist(), copies[qualified].tolist()):
+            # 保留第一份，移除其後完整重複的部分
+            remove[run_start + period:run_start + count * period] = True
+    
+    return remove
+
+
+# ==========================================
+# 分段接縫對齊（重疊區以文字與時間戳拼接）
+# ==========================================
+
+def longest_common_run(a, b):
+    """找出兩個詞代碼陣列的最長共同連續片段，回傳 (a 起點, b 起點, 長度)"""
+    best = (0, 0, 0)
+    if len(a) == 0 or len(b) == 0:
+        return best
+    
+    previous = np.zeros(len(b) + 1, dtype=np.int64)
+    for i in range(len(a)):
+        current = np.zeros(len(b) + 1, dtype=np.int64)
+        current[1:] = np.where(b == a[i], previous[:-1] + 1, 0)
+        j = int(current.argmax())
+        if current[j] > best[2]:
+            length = int(current[j])
+            best = (i - length + 1, j - length, length)
+        previous = current
+    return best
+
+
+def _token_times(store, rows, owners, char_starts, char_ends):
+    """估計每個詞的時間（所在字詞的時間戳，或詞在片段文字中的位置比例）"""
+    times = np.empty(len(owners))
+    for local, row in enumerate(rows.tolist()):
+        tokens = owners == local
+        times[tokens] = store.char_times(row, (char_starts[tokens] + char_ends[tokens]) / 2)
+    return times
+
+
+def _window_tokens(times, overlap_start, overlap_end):
+    """回傳時間落在重疊區內的連續詞範圍 [first, last)"""
+    inside = np.flatnonzero((times >= overlap_start) & (times <= overlap_end))
+    if len(inside) == 0:
+        return 0, 0
+    return int(inside[0]), int(inside[-1]) + 1
+
+
+def _cut_rows(store, keep, rows, owners, char_starts, cut, keep_before):
+    """在詞位置 cut 切開：keep_before 為 True 時保留 cut 之前的內容，否則保留 cut 之後"""
+    for local, row in enumerate(rows):
+        tokens = np.flatnonzero(owners == local)
+        if len(tokens) == 0:
+            # 重疊區內沒有文字的片段直接捨棄
+            keep[row] = False
+            continue
+        
+        first, last = int(tokens[0]), int(tokens[-1]) + 1
+        if keep_before:
+            if first >= cut:
+                keep[row] = False
+            elif last > cut:
+                store.keep_text_spans(row, [(0, char_starts[cut])])
+        else:
+            if last <= cut:
+                keep[row] = False
+            elif first < cut:
+                store.keep_text_spans(row, [(char_starts[cut], len(store.text(row)))])
+
+
+def stitch_chunk_pair(prev_store, prev_keep, next_store, next_keep, overlap_start, overlap_end, min_match=4):
+    """拼接相鄰兩段的重疊區，回傳是否以文字對齊成功"""
+    prev_rows = np.flatnonzero(prev_keep & (prev_store.end > overlap_start))
+    next_rows = np.flatnonzero(next_keep & (next_store.start < overlap_end))
+    if len(prev_rows) == 0 or len(next_rows) == 0:
+        return False
+    
+    # 兩側一起斷詞，共用詞代碼
+    texts = [prev_store.text(r) for r in prev_rows] + [next_store.text(r) for r in next_rows]
+    token_ids, owners, char_starts, char_ends = tokenize_segments(texts)
+    split = np.searchsorted(owners, len(prev_rows))
+    prev_ids, next_ids = token_ids[:split], token_ids[split:]
+    prev_owners, next_owners = owners[:split], owners[split:] - len(prev_rows)
+    prev_chars, next_chars = char_starts[:split], char_starts[split:]
+    
+    # 只在時間落於重疊區內的詞中找共同片段，避免對到重疊區外碰巧相同的文字
+    prev_first, prev_last = _window_tokens(
+        _token_times(prev_store, prev_rows, prev_owners, prev_chars, char_ends[:split]),
+        overlap_start, overlap_end)
+    next_first, next_last = _window_tokens(
+        _token_times(next_store, next_rows, next_owners, next_chars, char_ends[split:]),
+        overlap_start, overlap_end)
+    prev_at, next_at, length = longest_common_run(prev_ids[prev_first:prev_last], next_ids[next_first:next_last])
+    prev_at += prev_first
+    next_at += next_first
+    
+    if length >= min_match:
+        # 比較兩側對齊部分的信心度，保留較高的一方
+        prev_conf = prev_store.avg_logprob[prev_rows[np.unique(prev_owners[prev_at:prev_at + length])]].mean()
+        next_conf = next_store.avg_logprob[next_rows[np.unique(next_owners[next_at:next_at + length])]].mean()
+        if prev_conf >= next_conf:
+            prev_cut, next_cut = prev_at + length, next_at + length
+        else:
+            prev_cut, next_cut = prev_at, next_at
+        
+        _cut_rows(prev_store, prev_keep, prev_rows, prev_owners, prev_chars, prev_cut, keep_before=True)
+        _cut_rows(next_store, next_keep, next_rows, next_owners, next_chars, next_cut, keep_before=False)
+        return True
+    
+    # 文字無法對齊（例如重疊區是靜音）：前段內容保留到前段結束，後段只捨棄
+    # 前段結束前的詞；跨過接縫的片段依時間裁切，不整段捨棄
+    for row in next_rows.tolist():
+        if next_store.end[row] <= overlap_end:
+            next_keep[row] = False
+        else:
+            next_keep[row] = next_store.keep_time_range(row, start=overlap_end)
+    return False
+
+
+def stitch_chunks(chunks):
+    """依時間順序拼接各段結果，chunks 為 (起始秒, 結束秒, SegmentStore) 清單
+    
+    各段可以任意順序完成轉錄，拼接前會依起始時間排序。
+    回傳 (合併後的 SegmentStore, 文字對齊成功的接縫數)。
+    """
+    chunks = sorted(chunks, key=lambda c: c[0])
+    keeps = [np.ones(len(store), dtype=bool) for _, _, store in chunks]
+    aligned = 0
+    
+    for k in range(1, len(chunks)):
+        prev_start, prev_end, prev_store = chunks[k - 1]
+        next_start, next_end, next_store = chunks[k]
+        if next_start < prev_end:
+            aligned += stitch_chunk_pair(prev_store, keeps[k - 1], next_store, keeps[k],
+                                         next_start, prev_end)
+    
+    combined = SegmentStore(capacity=sum(int(keep.sum()) for keep in keeps) or 1)
+    for (_, _, store), keep in zip(chunks, keeps):
+        combined.extend_store(store.select(keep))
+    return combined, aligned
+
+
+# ==========================================
+# 近似重複偵測（字元 shingle + MinHash）
+# ==========================================
+
+def _mix64(values):
+    """splitmix64 混合函數（uint64 陣列，乘法溢位即為取模）"""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+class MinHasher:
+    """以字元 shingle 與 MinHash 估計片段之間的 Jaccard 相似度"""
+    
+    def __init__(self, num_perm=64, shingle_size=3, seed=1):
+        rng = np.random.default_rng(seed)
+        # 每個雜湊函數以不同的種子與 shingle 雜湊值混合
+        self.seeds = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+    
+    def shingles(self, text):
+        """取得文字的 shingle 雜湊值（短於 shingle 長度時整段視為一個）"""
+        k = self.shingle_size
+        if len(text) <= k:
+            return [zlib.crc32(text.encode('utf-8'))] if text else []
+        return [zlib.crc32(text[i:i + k].encode('utf-8')) for i in range(len(text) - k + 1)]
+    
+    def signatures(self, texts):
+        """計算所有文字的 MinHash 簽章，回傳 (簽章矩陣, 是否有效)"""
+        n = len(texts)
+        hashes = []
+        counts = np.zeros(n, dtype=np.int64)
+        for i, text in enumerate(texts):
+            shingles = self.shingles(text)
+            hashes.extend(shingles)
+            counts[i] = len(shingles)
+        
+        signatures = np.zeros((n, self.num_perm), dtype=np.uint64)
+        valid = counts > 0
+        if not valid.any():
+            return signatures, valid
+        
+        values = np.array(hashes, dtype=np.uint64)
+        group_starts = (np.cumsum(counts) - counts)[valid]
+        # 每個雜湊函數各做一次向量化運算，避免建立 (shingle 數 × num_perm) 的大矩陣
+        for k in range(self.num_perm):
+            permuted = _mix64(values ^ self.seeds[k])
+            signatures[valid, k] = np.minimum.reduceat(permuted, group_starts)
+        return signatures, valid
+    
+    def neighbour_similarity(self, signatures, window):
+        """計算每個片段與其後 window 個片段的相似度，回傳 (n, window) 矩陣"""
+        n = len(signatures)
+        similarity = np.zeros((n, window), dtype=np.float64)
+        for d in range(1, min(window, n - 1) + 1):
+            similarity[:n - d, d - 1] = (signatures[:-d] == signatures[d:]).mean(axis=1)
+        return similarity
+
+
+# ==========================================
+# 重轉排程（嚴重度排序、時間預算）
+# ==========================================
+
+# 重轉策略（依預設嘗試順序）
+RETRY_STRATEGIES = ("temperature", "zh", "ja", "beam_search")
+# 兩階段模式以大模型精修草稿（記錄於片段的 retry_strategy 欄位）
+REFINE_STRATEGY = len(RETRY_STRATEGIES)
+RETRY_STRATEGY_NAMES = {
+    "temperature": "提高溫度",
+    "zh": "指定中文",
+    "ja": "指定日文",
+    "beam_search": "集束搜尋",
+}
+
+
+class RetryStrategyHistory:
+    """保存在輸出資料夾中的重轉策略成功率紀錄"""
+    
+    FILENAME = ".retry_strategy_stats.json"
+    
+    def __init__(self, folder):
+        self.path = os.path.join(folder, self.FILENAME)
+        self.trials = {s: 0 for s in RETRY_STRATEGIES}
+        self.successes = {s: 0 for s in RETRY_STRATEGIES}
+        self.load()
+    
+    def load(self):
+        """讀取紀錄（檔案不存在或損壞時從頭開始）"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for strategy in RETRY_STRATEGIES:
+                stats = data.get(strategy, {})
+                self.trials[strategy] = int(stats.get("trials", 0))
+                self.successes[strategy] = int(stats.get("successes", 0))
+        except (OSError, ValueError, AttributeError):
+            pass
+    
+    def save(self):
+        """寫回紀錄"""
+        data = {
+            s: {"trials": self.trials[s], "successes": self.successes[s]}
+            for s in RETRY_STRATEGIES
+        }
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except OSError:
+            pass
+    
+    def merge(self, scheduler):
+        """併入單一檔案的重轉結果"""
+        for strategy in RETRY_STRATEGIES:
+            self.trials[strategy] += scheduler.trials[strategy]
+            self.successes[strategy] += scheduler.successes[strategy]
+
+
+class RetryScheduler:
+    """依嚴重程度排序語意不明片段，並控制單一檔案的重轉時間預算"""
+    
+    def __init__(self, audio_duration, budget_ratio, min_trials=4, min_success_rate=0.15, history=None):
+        # budget_ratio <= 0 表示不限制
+        if budget_ratio > 0:
+            self.budget_seconds = audio_duration * budget_ratio
+        else:
+            self.budget_seconds = float('inf')
+        self.min_trials = min_trials
+        self.min_success_rate = min_success_rate
+        self.history = history
+        
+        self.elapsed = 0.0
+        self.skipped = 0
+        self.trials = {s: 0 for s in RETRY_STRATEGIES}
+        self.successes = {s: 0 for s in RETRY_STRATEGIES}
+        self.disabled = set()
+    
+    def rank(self, segments, masks, flagged):
+        """依嚴重程度排序（信心度越低、原因越多、片段越長越優先）"""
+        if len(flagged) == 0:
+            return flagged
+        logprob = segments.avg_logprob[flagged]
+        duration = segments.end[flagged] - segments.start[flagged]
+        reason_count = np.unpackbits(masks[flagged][:, None], axis=1).sum(axis=1)
+        
+        severity = -logprob + 0.5 * reason_count + 0.05 * np.minimum(duration, 30.0)
+        return flagged[np.argsort(-severity, kind='stable')]
+    
+    def skip_unused_languages(self, script_counts):
+        """整份逐字稿只有拉丁字母（沒有假名與漢字）時，跳過強制指定中文／日文的策略
+        
+        只要有漢字就兩者都保留：日文音訊被誤判為中文時逐字稿可能完全沒有假名，
+        正是強制日文要修正的情況；是否值得嘗試交給各策略的成功率決定。
+        """
+        cjk = (script_counts[ScriptClassifier.KANA] + script_counts[ScriptClassifier.HAN]
+               + script_counts[ScriptClassifier.SIMPLIFIED] + script_counts[ScriptClassifier.TRADITIONAL])
+        if cjk > 0 or script_counts[ScriptClassifier.LATIN] == 0:
+            return []
+        skipped = ["zh", "ja"]
+        self.disabled.update(skipped)
+        return skipped
+    
+    def success_rate(self, strategy):
+        """結合歷史紀錄與本檔案結果的平滑成功率"""
+        trials = self.trials[strategy]
+        successes = self.successes[strategy]
+        if self.history:
+            trials += self.history.trials[strategy]
+            successes += self.history.successes[strategy]
+        return (successes + 1) / (trials + 2)
+    
+    def ordered_strategies(self, limit):
+        """依成功率重新排序可用策略，最多回傳 limit 個"""
+        available = [s for s in RETRY_STRATEGIES if s not in self.disabled]
+        # sorted 為穩定排序，成功率相同時維持預設順序
+        available.sort(key=self.success_rate, reverse=True)
+        return available[:limit]
+    
+    def has_budget(self):
+        """是否還有重轉時間預算"""
+        return self.elapsed < self.budget_seconds
+    
+    def strategy_enabled(self, strategy):
+        """策略在本檔案的成功率是否仍值得嘗試"""
+        return strategy not in self.disabled
+    
+    def charge(self, seconds):
+        """計入重轉耗時"""
+        self.elapsed += seconds
+    
+    def record(self, strategy, improved, elapsed=0.0):
+        """記錄一次重轉結果，若策略因成功率過低而停用則回傳 True"""
+        self.elapsed += elapsed
+        self.trials[strategy] += 1
+        if improved:
+            self.successes[strategy] += 1
+        
+        trials = self.trials[strategy]
+        if (strategy not in self.disabled and trials >= self.min_trials
+                and self.successes[strategy] / trials < self.min_success_rate):
+            self.disabled.add(strategy)
+            return True
+        return False
+    
+    def format_budget(self):
+        """格式化預算"""
+        if self.budget_seconds == float('inf'):
+            return "不限制"
+        return f"{self.budget_seconds:.0f} 秒"
+    
+    def report(self):
+        """產生預算使用報告"""
+        if self.budget_seconds == float('inf'):
+            usage = f"重轉耗時 {self.elapsed:.1f} 秒（不限制）"
+        else:
+            percent = self.elapsed / self.budget_seconds * 100 if self.budget_seconds > 0 else 100.0
+            usage = f"重轉耗時 {self.elapsed:.1f} / {self.budget_seconds:.0f} 秒（{percent:.0f}%）"
+        
+        strategy_stats = "、".join(
+            f"{RETRY_STRATEGY_NAMES[s]} {self.successes[s]}/{self.trials[s]}"
+            for s in RETRY_STRATEGIES if self.trials[s] > 0
+        )
+        if strategy_stats:
+            usage += f"，策略成功率：{strategy_stats}"
+        if self.skipped:
+            usage += f"，因預算略過 {self.skipped} 個片段"
+        return usage
+
+
+# 小模型初篩結果
+DRAFT_SILENT = "silent"
+DRAFT_CONFIRMED = "confirmed"
+DRAFT_ESCALATE = "escalate"
+
+DRAFT_VERDICT_NAMES = {
+    DRAFT_SILENT: "靜音／雜訊",
+    DRAFT_CONFIRMED: "小模型結果一致",
+    DRAFT_ESCALATE: "升級大模型",
+}
+
+
+class DraftScreening:
+    """小模型初篩統計：升級率與估計省下的大模型重轉時間"""
+    
+    def __init__(self):
+        self.counts = {verdict: 0 for verdict in DRAFT_VERDICT_NAMES}
+        self.draft_time = 0.0
+        self.escalated_time = 0.0
+    
+    @property
+    def screened(self):
+        return sum(self.counts.values())
+    
+    def record(self, verdict, elapsed):
+        self.counts[verdict] += 1
+        self.draft_time += elapsed
+    
+    def escalation_rate(self):
+        return self.counts[DRAFT_ESCALATE] / self.screened if self.screened else 0.0
+    
+    def time_saved(self):
+        """以升級片段的平均大模型重轉時間，估計未升級片段省下的時間（扣除初篩耗時）"""
+        escalated = self.counts[DRAFT_ESCALATE]
+        if escalated == 0:
+            return None
+        average = self.escalated_time / escalated
+        return (self.screened - escalated) * average - self.draft_time
+    
+    def report(self):
+        """產生初篩報告"""
+        text = (f"小模型初篩 {self.screened} 個片段，升級 {self.counts[DRAFT_ESCALATE]} 個"
+                f"（{self.escalation_rate() * 100:.0f}%），"
+                f"{DRAFT_VERDICT_NAMES[DRAFT_SILENT]} {self.counts[DRAFT_SILENT]} 個、"
+                f"{DRAFT_VERDICT_NAMES[DRAFT_CONFIRMED]} {self.counts[DRAFT_CONFIRMED]} 個，"
+                f"初篩耗時 {self.draft_time:.1f} 秒")
+        saved = self.time_saved()
+        if saved is not None:
+            text += f"，估計省下 {saved:.1f} 秒"
+        return text
+
+
+# ==========================================
+# ffmpeg / ffprobe 偵測（跨平台，結果快取）
+# ==========================================
+
+# 可用環境變數 AUDIOTOTEXTS_FFMPEG_DIR 指定 ffmpeg 所在資料夾
+FFMPEG_DIR = os.environ.get("AUDIOTOTEXTS_FFMPEG_DIR", "")
+FFMPEG_CACHE_FILE = os.path.join(USER_CACHE_DIR, "ffmpeg_probe.json")
+
+
+class FFmpegInfo:
+    """ffmpeg / ffprobe 的路徑、版本與可用的音訊解碼器"""
+    
+    def __init__(self, ffmpeg=None, ffprobe=None, version="", audio_decoders=()):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.version = version
+        self.audio_decoders = frozenset(audio_decoders)
+    
+    def summary(self):
+        if not self.ffmpeg:
+            return "未找到"
+        return f"{self.version or '版本不明'}，{len(self.audio_decoders)} 種音訊解碼器（{self.ffmpeg}）"
+
+
+_FFMPEG_INFO = None
+_FFMPEG_LOCK = threading.Lock()
+
+
+def _find_binary(name):
+    """依序尋找：指定資料夾、程式資料夾、目前資料夾、系統 PATH"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    folders = [FFMPEG_DIR, script_dir, os.path.join(script_dir, "ffmpeg", "bin"), os.getcwd()]
+    for folder in filter(None, folders):
+        path = shutil.which(name, path=folder)
+        if path:
+            return os.path.abspath(path)
+    return shutil.which(name)
+
+
+def _binary_key(path):
+    """以路徑、大小與修改時間判斷執行檔是否變更"""
+    if not path:
+        return None
+    st = os.stat(path)
+    return [path, st.st_size, int(st.st_mtime)]
+
+
+def _probe_ffmpeg(ffmpeg):
+    """執行 ffmpeg 取得版本與音訊解碼器清單（較慢，結果寫入快取）"""
+    version = ""
+    decoders = []
+    try:
+        result = subprocess.run([ffmpeg, "-hide_banner", "-version"], capture_output=True, text=True, timeout=10)
+        first_line = result.stdout.splitlines()[0] if result.stdout else ""
+        version = " ".join(first_line.split()[:3])
+        
+        result = subprocess.run([ffmpeg, "-hide_banner", "-decoders"], capture_output=True, text=True, timeout=10)
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            # 解碼器行格式：" A....D aac  AAC (Advanced Audio Coding)"
+            if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] == "A":
+                decoders.append(parts[1])
+    except (OSError, IndexError, subprocess.SubprocessError):
+        pass
+    return version, decoders
+
+
+def discover_ffmpeg(refresh=False):
+    """尋找 ffmpeg 與 ffprobe 並回傳 FFmpegInfo
+    
+    執行檔未變更時沿用使用者快取資料夾中 ffmpeg_probe.json 的版本與解碼器資訊，不重新執行 ffmpeg。
+    找到後將所在資料夾加入 PATH，讓解碼管線與工作程序都使用同一份 ffmpeg。
+    """
+    global _FFMPEG_INFO
+    with _FFMPEG_LOCK:
+        if _FFMPEG_INFO is not None and not refresh:
+            return _FFMPEG_INFO
+        
+        ffmpeg = _find_binary("ffmpeg")
+        ffprobe = _find_binary("ffprobe")
+        key = [_binary_key(ffmpeg), _binary_key(ffprobe)]
+        
+        cached = None
+        if not refresh:
+            try:
+                with open(FFMPEG_CACHE_FILE, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                pass
+        
+        if cached and cached.get("key") == key:
+            version, decoders = cached.get("version", ""), cached.get("audio_decoders", [])
+        else:
+            version, decoders = _probe_ffmpeg(ffmpeg) if ffmpeg else ("", [])
+            try:
+                os.makedirs(os.path.dirname(FFMPEG_CACHE_FILE), exist_ok=True)
+                with open(FFMPEG_CACHE_FILE, "w", encoding="utf-8") as f:
+                    json.dump({"key": key, "version": version, "audio_decoders": decoders}, f)
+            except OSError:
+                pass
+        
+        # 將找到的資料夾放到 PATH 最前面
+        path_dirs = os.environ.get("PATH", "").split(os.pathsep)
+        for binary in (ffprobe, ffmpeg):
+            folder = os.path.dirname(binary) if binary else ""
+            if folder and folder not in path_dirs:
+                os.environ["PATH"] = folder + os.pathsep + os.environ.get("PATH", "")
+                path_dirs.insert(0, folder)
+        
+        _FFMPEG_INFO = FFmpegInfo(ffmpeg, ffprobe, version, decoders)
+        return _FFMPEG_INFO
+
+
+def ffmpeg_binary(name="ffmpeg"):
+    """回傳偵測到的 ffmpeg / ffprobe 路徑，找不到時回傳名稱本身"""
+    info = discover_ffmpeg()
+    return (info.ffprobe if name == "ffprobe" else info.ffmpeg) or name
+
+
+# ==========================================
+# 音訊解碼服務（PyAV 程序內解碼，否則以 ffmpeg 管線）
+# ==========================================
+
+# Whisper 使用的取樣率
+SAMPLE_RATE = 16000
+
+
+class AudioDecoder:
+    """將音檔解碼為 Whisper 使用的 16 kHz 單聲道 float32 陣列，所有轉錄與重轉路徑共用
+    
+    有 PyAV 時在程序內解碼，並保留最近開啟的檔案（容器與解碼器），同一檔案的多段擷取
+    只需 seek，不必每段重新啟動 ffmpeg 程序與初始化解碼器；沒有 PyAV 或 PyAV 無法開啟時
+    改以 ffmpeg 管線解碼。prefetch() 於背景執行緒先解碼下一段，與模型推論重疊。
+    """
+    
+    def __init__(self, max_open=2, prefetch_workers=1):
+        self.use_pyav = PYAV_AVAILABLE
+        self.max_open = max_open
+        self.prefetch_workers = prefetch_workers
+        self._containers = OrderedDict()
+        self._pyav_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = {}
+        self.decode_count = 0
+        self.decode_time = 0.0
+        self.prefetch_hits = 0
+    
+    @property
+    def backend(self):
+        return "PyAV（程序內解碼）" if self.use_pyav else "ffmpeg 管線"
+    
+    @staticmethod
+    def _key(path, start, duration):
+        return (path, round(start, 3), None if duration is None else round(duration, 3))
+    
+    def decode(self, path, start=0.0, duration=None):
+        """解碼 path 從 start 秒起 duration 秒（None 表示到結尾），已預先解碼時直接取用"""
+        with self._lock:
+            future = self._pending.pop(self._key(path, start, duration), None)
+            if future is not None:
+                self.prefetch_hits += 1
+        if future is not None:
+            return future.result()
+        return self._decode(path, start, duration)
+    
+    def prefetch(self, path, start=0.0, duration=None):
+        """於背景執行緒先解碼，之後以相同參數呼叫 decode() 時取用"""
+        key = self._key(path, start, duration)
+        with self._lock:
+            if key in self._pending:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.prefetch_workers)
+            self._pending[key] = self._executor.submit(self._decode, path, start, duration)
+    
+    def _decode(self, path, start, duration):
+        start_time = time.perf_counter()
+        audio = None
+        if self.use_pyav:
+            try:
+                audio = self._decode_pyav(path, start, duration)
+            except Exception:
+                # PyAV 無法處理的格式改由 ffmpeg 解碼
+                self.close(path)
+        if audio is None:
+            audio = self._decode_ffmpeg(path, start, duration)
+        with self._lock:
+            self.decode_count += 1
+            self.decode_time += time.perf_counter() - start_time
+        return audio
+    
+    def _open(self, path):
+        """取得已開啟的容器，超過 max_open 時關閉最久未用的"""
+        container = self._containers.pop(path, None)
+        if container is None:
+            container = av.open(path)
+            while len(self._containers) >= self.max_open:
+                _, oldest = self._containers.popitem(last=False)
+                oldest.close()
+        self._containers[path] = container
+        return container
+    
+    def _decode_pyav(self, path, start, duration):
+        with self._pyav_lock:
+            container = self._open(path)
+            stream = container.streams.audio[0]
+            container.seek(int(max(0.0, start) * av.time_base))
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+            
+            pieces = []
+            collected = 0
+            skip = 0
+            needed = None
+            first_frame = True
+            for frame in container.decode(stream):
+                if first_frame:
+                    # seek 停在關鍵影格，略過到 start 之前的取樣
+                    first_frame = False
+                    frame_time = frame.time if frame.time is not None else start
+                    skip = max(0, int(round((start - frame_time) * SAMPLE_RATE)))
+                    if duration is not None:
+                        needed = skip + int(round(duration * SAMPLE_RATE))
+                for out in resampler.resample(frame):
+                    data = out.to_ndarray().reshape(-1)
+                    pieces.append(data)
+                    collected += len(data)
+                if needed is not None and collected >= needed:
+                    break
+            else:
+                for out in resampler.resample(None):
+                    pieces.append(out.to_ndarray().reshape(-1))
+        
+        if not pieces:
+            return np.zeros(0, dtype=np.float32)
+        samples = np.concatenate(pieces)[skip:needed]
+        return samples.astype(np.float32) / 32768.0
+    
+    @staticmethod
+    def _decode_ffmpeg(path, start, duration):
+        cmd = [ffmpeg_binary(), "-nostdin", "-v", "error"]
+        if start > 0:
+            cmd += ["-ss", f"{start:.3f}"]
+        if duration is not None:
+            cmd += ["-t", f"{duration:.3f}"]
+        cmd += ["-i", path, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"]
+        output = subprocess.run(cmd, capture_output=True, check=True).stdout
+        return np.frombuffer(output, dtype=np.int16).astype(np.float32) / 32768.0
+    
+    def close(self, path=None):
+        """關閉指定檔案（或全部）的容器"""
+        with self._pyav_lock:
+            paths = [path] if path is not None else list(self._containers)
+            for name in paths:
+                container = self._containers.pop(name, None)
+                if container is not None:
+                    container.close()
+    
+    def reset(self):
+        """捨棄未取用的預先解碼並關閉所有容器（換檔或結束時呼叫）"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.cancel()
+        for future in pending.values():
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        self.close()
+    
+    def report(self):
+        return (f"{self.backend}，解碼 {self.decode_count} 次共 {self.decode_time:.1f} 秒，"
+                f"預先解碼命中 {self.prefetch_hits} 次")
+
+
+_AUDIO_DECODER = None
+
+
+def get_audio_decoder():
+    """取得共用的解碼服務（第一次使用時建立）"""
+    global _AUDIO_DECODER
+    if _AUDIO_DECODER is None:
+        _AUDIO_DECODER = AudioDecoder()
+    return _AUDIO_DECODER
+
+
+# ==========================================
+# 重轉執行（主程序與工作程序共用）
+# ==========================================
+
+class AudioRange:
+    """音訊分段：記錄在檔案中的位置；已解碼整檔時直接切片，否則需要時才解碼這一段"""
+    
+    def __init__(self, path, start_ms, length_ms, audio=None):
+        self.path = path
+        self.start_ms = start_ms
+        self.length_ms = length_ms
+        self.audio = audio
+    
+    def __len__(self):
+        return self.length_ms
+    
+    def to_array(self):
+        if self.audio is not None:
+            start = self.start_ms * SAMPLE_RATE // 1000
+            return self.audio[start:start + self.length_ms * SAMPLE_RATE // 1000]
+        return get_audio_decoder().decode(self.path, self.start_ms / 1000.0, self.length_ms / 1000.0)
+    
+    def prefetch(self):
+        """於背景先解碼這一段（已解碼整檔時不需要）"""
+        if self.audio is None:
+            get_audio_decoder().prefetch(self.path, self.start_ms / 1000.0, self.length_ms / 1000.0)
+
+
+# 重轉時前後各延伸的秒數
+RETRY_CLIP_PADDING = 0.5
+
+
+def transcribe_retry_clip(model, segment, audio, options, encoder_cache=None):
+    """轉錄重轉用的音訊片段，回傳沿用原時間戳的新片段
+    
+    片段內可能被切成多個子片段，落在片段範圍內的全部合併：文字依序串接，
+    信心度依文字長度加權平均，靜音機率取最低、壓縮比取最高。
+    """
+    clip_offset = max(0.0, segment["start"] - RETRY_CLIP_PADDING)
+    if encoder_cache is not None and encoder_cache.supports(audio, options):
+        result = encoder_cache.transcribe(audio, options, clip_offset)
+    else:
+        result = model.transcribe(audio, **options)
+    
+    # 子片段時間以片段開頭為 0，只取與 [片段起點 - 延伸, 片段終點 + 延伸] 重疊的部分
+    clip_end = segment["end"] + RETRY_CLIP_PADDING - clip_offset
+    parts = [seg for seg in result.get("segments") or []
+             if seg.get("text", "").strip() and seg.get("start", 0) < clip_end and seg.get("end", clip_end) > 0]
+    if not parts:
+        return None
+    
+    weights = np.array([max(len(seg["text"].strip()), 1) for seg in parts], dtype=np.float64)
+    new_seg = {
+        "start": segment["start"],
+        "end": segment["end"],
+        "text": "".join(seg["text"] for seg in parts).strip(),
+        "avg_logprob": float(np.average([seg.get("avg_logprob", 0) for seg in parts], weights=weights)),
+        "no_speech_prob": min(seg.get("no_speech_prob", 0) for seg in parts),
+        "compression_ratio": max(seg.get("compression_ratio", 1) for seg in parts),
+    }
+    if all(seg.get("words") for seg in parts):
+        # 字詞時間戳換算回整個檔案的時間
+        new_seg["words"] = [dict(w, start=w["start"] + clip_offset, end=w["end"] + clip_offset)
+                            for seg in parts for w in seg["words"]]
+    return new_seg
+
+
+def record_retry_history(segments, index, history):
+    """將重轉紀錄累加到片段欄位（兩階段模式的精修也算一次）：嘗試次數、耗時、最後採用的策略"""
+    segments.set_column("retry_attempts", index, segments.retry_attempts[index] + len(history))
+    segments.set_column("retry_seconds", index,
+                        segments.retry_seconds[index] + sum(record[1] for record in history))
+    improved = [record[0] for record in history if record[2]]
+    if improved:
+        segments.set_column("retry_strategy", index, RETRY_STRATEGIES.index(improved[-1]))
+
+
+def run_retry_attempts(model, segment, mask, audio, attempts, confidence_threshold,
+                       should_try=None, on_attempt=None, encoder_cache=None):
+    """依序嘗試各重轉策略，回傳 (最佳片段, 嘗試紀錄)"""
+    best_seg = segment
+    best_score = segment.get("avg_logprob", -999)
+    reason_count = count_unclear_reasons(mask)
+    history = []
+    
+    for strategy, options in attempts:
+        if should_try and not should_try(strategy):
+            continue
+        
+        attempt_start = time.time()
+        new_seg = None
+        new_mask = None
+        improved = False
+        error = None
+        
+        try:
+            new_seg = transcribe_retry_clip(model, segment, audio, options, encoder_cache)
+        except Exception as e:
+            error = str(e)
+        
+        if new_seg:
+            new_score = new_seg.get("avg_logprob", -999)
+            new_mask = score_unclear_segments([new_seg], confidence_threshold)[0]
+            
+            # 如果新結果更好
+            if new_score > best_score and count_unclear_reasons(new_mask) < reason_count:
+                best_seg = new_seg
+                best_score = new_score
+                improved = True
+        
+        record = (strategy, time.time() - attempt_start, improved, new_seg if improved else None, error)
+        history.append(record)
+        if on_attempt:
+            on_attempt(*record)
+        
+        # 所有問題都已排除，不必再試其他策略
+        if improved and new_mask == 0:
+            break
+    
+    return best_seg, history
+
+
+def text_similarity(a, b, hasher=None):
+    """以 MinHash 估計兩段文字的相似度（忽略大小寫與標點）"""
+    hasher = hasher or MinHasher()
+    texts = [NON_WORD_RE.sub('', a.lower()), NON_WORD_RE.sub('', b.lower())]
+    signatures, valid = hasher.signatures(texts)
+    if not valid.all():
+        return 1.0 if not valid.any() else 0.0
+    return float((signatures[0] == signatures[1]).mean())
+
+
+def draft_screen_segment(draft_model, segment, mask, audio, options, confidence_threshold,
+                         agreement=0.5, encoder_cache=None):
+    """以小模型先轉一次，判斷片段是否需要交給大模型重轉，回傳 (判定, 耗時)
+    
+    小模型也聽不到內容、且原片段本來就被判為無語音或過短時視為靜音／雜訊；
+    小模型結果清楚且與原文一致時視為原文可信；其餘（小模型也不清楚或與原文不一致）升級。
+    """
+    start_time = time.time()
+    try:
+        draft = transcribe_retry_clip(draft_model, segment, audio, options, encoder_cache)
+    except Exception:
+        return DRAFT_ESCALATE, time.time() - start_time
+    
+    if draft is None or not draft["text"]:
+        verdict = DRAFT_SILENT if mask & (UNCLEAR_NO_SPEECH | UNCLEAR_TOO_SHORT) else DRAFT_ESCALATE
+    elif (score_unclear_segments([draft], confidence_threshold)[0] == 0
+            and text_similarity(draft["text"], segment["text"]) >= agreement):
+        verdict = DRAFT_CONFIRMED
+    else:
+        verdict = DRAFT_ESCALATE
+    return verdict, time.time() - start_time
+
+
+# ==========================================
+# 模型載入（本機權重快取，mmap 載入）
+# ==========================================
+
+# 預設放在使用者快取資料夾，可用環境變數 AUDIOTOTEXTS_MODEL_DIR 指定；預先放好檔案即可離線使用
+MODEL_CACHE_DIR = os.environ.get("AUDIOTOTEXTS_MODEL_DIR") or os.path.join(USER_CACHE_DIR, "models")
+
+
+class ModelCache:
+    """將 Whisper 檢查點轉換一次後存於本機，之後以 mmap 載入
+    
+    有 safetensors 時存成 .safetensors，否則存成 torch.load(mmap=True) 可對應的 .mmap.pt。
+    權重轉為 float32 並以 load_state_dict(assign=True) 直接使用對應的記憶體，
+    多個 CPU 工作程序可共用同一份分頁。
+    """
+    
+    def __init__(self, cache_dir=MODEL_CACHE_DIR):
+        self.cache_dir = cache_dir
+    
+    def converted_path(self, name):
+        ext = ".safetensors" if SAFETENSORS_AVAILABLE else ".mmap.pt"
+        return os.path.join(self.cache_dir, f"{name}{ext}")
+    
+    def source_checkpoint(self, name):
+        """找出原始 .pt 檢查點（快取資料夾、Whisper 預設資料夾），都沒有時才下載"""
+        default_root = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+                                    "whisper")
+        for root in (self.cache_dir, default_root):
+            path = os.path.join(root, f"{name}.pt")
+            if os.path.isfile(path):
+                return path
+        if os.path.isfile(name):
+            return name
+        if name in whisper._MODELS:
+            return whisper._download(whisper._MODELS[name], default_root, False)
+        raise RuntimeError(f"找不到模型 {name}")
+    
+    def convert(self, name):
+        """將原始檢查點轉成可 mmap 的格式（先寫暫存檔再改名，避免留下不完整的快取）"""
+        checkpoint = torch.load(self.source_checkpoint(name), map_location="cpu")
+        dims = checkpoint["dims"]
+        state = {key: (value.float() if value.is_floating_point() else value).contiguous()
+                 for key, value in checkpoint["model_state_dict"].items()}
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.converted_path(name)
+        temp_path = path + ".tmp"
+        if SAFETENSORS_AVAILABLE:
+            timed_import("safetensors.torch").save_file(state, temp_path, metadata={"dims": json.dumps(dims)})
+        else:
+            torch.save({"dims": dims, "model_state_dict": state}, temp_path)
+        os.replace(temp_path, path)
+    
+    def read(self, name):
+        """以 mmap 讀取已轉換的權重，回傳 (dims, state_dict)"""
+        path = self.converted_path(name)
+        if SAFETENSORS_AVAILABLE:
+            with timed_import("safetensors").safe_open(path, framework="pt", device="cpu") as f:
+                dims = json.loads(f.metadata()["dims"])
+                state = {key: f.get_tensor(key) for key in f.keys()}
+            return dims, state
+        try:
+            checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        except TypeError:
+            # 舊版 torch 沒有 mmap 參數
+            checkpoint = torch.load(path, map_location="cpu")
+        return checkpoint["dims"], checkpoint["model_state_dict"]
+    
+    def load(self, name, device):
+        """載入模型，回傳 (模型, 是否為暖啟動)"""
+        warm = os.path.isfile(self.converted_path(name))
+        if not warm:
+            self.convert(name)
+        
+        dims, state = self.read(name)
+        model = whisper.Whisper(whisper.ModelDimensions(**dims))
+        try:
+            model.load_state_dict(state, assign=True)
+        except TypeError:
+            model.load_state_dict(state)
+        
+        alignment_heads = whisper._ALIGNMENT_HEADS.get(name)
+        if alignment_heads is not None:
+            model.set_alignment_heads(alignment_heads)
+        return model.to(device), warm
+
+
+def load_whisper_model(name, device, cache=None):
+    """優先由本機權重快取載入模型，失敗時退回 whisper.load_model，回傳 (模型, 說明)"""
+    cache = cache or ModelCache()
+    start_time = time.time()
+    try:
+        model, warm = cache.load(name, device)
+        kind = "暖啟動（mmap）" if warm else "冷啟動（已轉換並快取）"
+        return model, f"{kind} {time.time() - start_time:.1f} 秒"
+    except Exception as e:
+        model = whisper.load_model(name, device=device)
+        return model, f"快取不可用（{e}），以 whisper.load_model 載入 {time.time() - start_time:.1f} 秒"
+
+
+# ==========================================
+# CPU 工作程序（分段轉錄、重轉共用）
+# ==========================================
+
+# 工作程序中的模型與編碼快取（每個程序各自一份）
+_worker_model = None
+_worker_encoder_cache = None
+
+
+def _worker_init(model_name, num_threads):
+    """工作程序初始化：限制執行緒數並載入模型"""
+    global _worker_model, _worker_encoder_cache
+    torch.set_num_threads(num_threads)
+    _worker_model, _ = load_whisper_model(model_name, "cpu")
+    _worker_encoder_cache = EncoderCache(_worker_model)
+
+
+def _retry_worker_run(index, segment, mask, audio, attempts, confidence_threshold):
+    """在工作程序中重轉單一片段"""
+    best_seg, history = run_retry_attempts(_worker_model, segment, mask, audio,
+                                           attempts, confidence_threshold,
+                                           encoder_cache=_worker_encoder_cache)
+    return index, best_seg, history
+
+
+def _chunk_worker_run(index, offset_sec, end_sec, audio, options):
+    """在工作程序中轉錄單一分段，回傳 (索引, 起始秒, 結束秒, SegmentStore, 語言)"""
+    result = _worker_model.transcribe(audio, **options)
+    segments = SegmentStore.from_segments(result.get("segments", []), offset_sec)
+    return index, offset_sec, end_sec, segments, result.get("language", "unknown")
+
+
+# ==========================================
+# Log-mel 前端（整檔計算一次，供各視窗切片）
+# ==========================================
+
+# STFT 視窗依裝置快取（梅爾濾波器由 whisper.audio.mel_filters 自行快取）
+_stft_windows = {}
+
+
+def _stft_window(device):
+    key = str(device)
+    if key not in _stft_windows:
+        _stft_windows[key] = torch.hann_window(whisper.audio.N_FFT, device=device)
+    return _stft_windows[key]
+
+
+class MelFrontend:
+    """整檔 log-mel 頻譜：分塊計算 STFT，結果與 whisper.log_mel_spectrogram 相同
+    
+    全檔最大值於計算完成後才確定，因此儲存未正規化的 log10 值，切片時才套用
+    「最大值 - 8」下限與正規化；超出音訊範圍的 frame 以下限值補齊。
+    """
+    
+    def __init__(self, audio, n_mels, device="cpu", block_frames=30000):
+        self.n_mels = n_mels
+        self.n_frames = len(audio) // whisper.audio.HOP_LENGTH
+        self.log_spec = np.empty((n_mels, self.n_frames), dtype=np.float32)
+        
+        filters = whisper.audio.mel_filters(device, n_mels)
+        window = _stft_window(device)
+        for first in range(0, self.n_frames, block_frames):
+            last = min(first + block_frames, self.n_frames)
+            samples = torch.from_numpy(self.frame_samples(audio, first, last)).to(device)
+            stft = torch.stft(samples, whisper.audio.N_FFT, whisper.audio.HOP_LENGTH,
+                              window=window, center=False, return_complex=True)
+            mel = filters @ stft.abs() ** 2
+            self.log_spec[:, first:last] = torch.clamp(mel, min=1e-10).log10().cpu().numpy()
+        
+        self.floor = (float(self.log_spec.max()) if self.n_frames else -10.0) - 8.0
+    
+    @staticmethod
+    def frame_samples(audio, first, last):
+        """取出第 first 至 last-1 個 frame 需要的樣本，兩端以反射補齊（等同 center=True）"""
+        pad = whisper.audio.N_FFT // 2
+        lo = first * whisper.audio.HOP_LENGTH - pad
+        hi = (last - 1) * whisper.audio.HOP_LENGTH + whisper.audio.N_FFT - pad
+        left, right = max(0, -lo), max(0, hi - len(audio))
+        samples = np.asarray(audio[max(lo, 0):min(hi, len(audio))], dtype=np.float32)
+        if left or right:
+            samples = np.pad(samples, (left, right), mode="reflect")
+        return samples
+    
+    @property
+    def duration(self):
+        return self.n_frames * whisper.audio.HOP_LENGTH / whisper.audio.SAMPLE_RATE
+    
+    @property
+    def nbytes(self):
+        return self.log_spec.nbytes
+    
+    def frames(self, first, count=None):
+        """取出從 first 起 count 個 frame（預設 30 秒）的正規化 log-mel，回傳 (n_mels, count) 張量"""
+        count = whisper.audio.N_FRAMES if count is None else count
+        out = np.full((self.n_mels, count), self.floor, dtype=np.float32)
+        first = max(0, first)
+        available = max(0, min(count, self.n_frames - first))
+        if available:
+            np.maximum(self.log_spec[:, first:first + available], self.floor, out=out[:, :available])
+        return torch.from_numpy((out + 4.0) / 4.0)
+    
+    def window(self, start_sec, count=None):
+        """取出從 start_sec 秒開始的視窗"""
+        first = int(round(start_sec * whisper.audio.SAMPLE_RATE / whisper.audio.HOP_LENGTH))
+        return self.frames(first, count)
+
+
+# ==========================================
+# 批次解碼引擎（多個 30 秒視窗一起編碼、解碼）
+# ==========================================
+
+class BatchedDecoder:
+    """將多段音訊切成 30 秒視窗，由 MelFrontend 切出 log-mel，成批執行編碼器並批次解碼
+    
+    model.transcribe 會從上一個視窗最後一個完整時間戳記接續，視窗必須依序解碼；
+    這裡改為相鄰視窗重疊 WINDOW_OVERLAP 秒、各自獨立解碼（不以前文為條件），
+    再以 stitch_chunks 在重疊區對齊拼接，因此接縫附近的斷句不一定與逐段轉錄相同。
+    溫度退階只針對未通過閾值的視窗，以同一批編碼結果重新解碼。
+    """
+    
+    # 相鄰視窗重疊的秒數（讓被視窗邊界切斷的句子能在下一個視窗完整出現）
+    WINDOW_OVERLAP = 5
+    
+    def __init__(self, model, batch_size=8):
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        kwargs = {"num_languages": model.num_languages} if hasattr(model, "num_languages") else {}
+        self.tokenizer = whisper.tokenizer.get_tokenizer(model.is_multilingual, **kwargs)
+    
+    def transcribe(self, frontend, options, on_batch=None):
+        """轉錄單一檔案的 MelFrontend，回傳 (SegmentStore, 語言)"""
+        return self.transcribe_many([frontend], options, on_batch)[0]
+    
+    def transcribe_many(self, frontends, options, on_batch=None):
+        """轉錄多段音訊（可來自不同檔案），各段的視窗合併成批次
+        
+        回傳每段的 (SegmentStore, 語言)；on_batch(完成視窗數, 總視窗數) 於每批完成後呼叫
+        """
+        window = whisper.audio.N_FRAMES
+        seconds_per_frame = whisper.audio.HOP_LENGTH / whisper.audio.SAMPLE_RATE
+        overlap = int(self.WINDOW_OVERLAP / seconds_per_frame)
+        # 最後一個視窗只剩重疊部分時不必再解碼
+        windows = [(a, start) for a, frontend in enumerate(frontends)
+                   for start in range(0, max(frontend.n_frames - overlap, 1), window - overlap)]
+        chunks = [[] for _ in frontends]
+        languages = [{} for _ in frontends]
+        
+        for first in range(0, len(windows), self.batch_size):
+            batch = windows[first:first + self.batch_size]
+            mel = torch.stack([frontends[a].frames(start) for a, start in batch])
+            features = self.encode(mel, options.get("fp16", True))
+            results = self.decode_features(features, options)
+            
+            for (a, start), result in zip(batch, results):
+                offset = start * seconds_per_frame
+                duration = min(window, frontends[a].n_frames - start) * seconds_per_frame
+                store = SegmentStore()
+                if self.add_segments(store, result, offset, duration, options):
+                    languages[a][result.language] = languages[a].get(result.language, 0) + 1
+                chunks[a].append((offset, offset + duration, store))
+            
+            if on_batch:
+                on_batch(first + len(batch), len(windows))
+        
+        return [(stitch_chunks(file_chunks)[0], max(counts, key=counts.get) if counts else "unknown")
+                for file_chunks, counts in zip(chunks, languages)]
+    
+    def encode(self, mel, fp16):
+        """執行編碼器，回傳 (B, n_audio_ctx, n_audio_state) 的音訊特徵"""
+        dtype = torch.float16 if fp16 else torch.float32
+        with torch.no_grad():
+            return self.model.embed_audio(mel.to(self.model.device, dtype))
+    
+    def decode_features(self, features, options):
+        """依溫度序列解碼已編碼的特徵；只有未通過閾值的視窗會以下一個溫度重解"""
+        temperatures = options.get("temperature", 0.0)
+        if not isinstance(temperatures, (list, tuple)):
+            temperatures = (temperatures,)
+        
+        results = [None] * len(features)
+        pending = list(range(len(features)))
+        for temperature in temperatures:
+            decoded = whisper.decode(self.model, features[pending], self.decoding_options(options, temperature))
+            retry = []
+            for index, result in zip(pending, decoded):
+                results[index] = result
+                if self.needs_fallback(result, options):
+                    retry.append(index)
+            pending = retry
+            if not pending:
+                break
+        
+        return results
+    
+    @staticmethod
+    def decoding_options(options, temperature):
+        """由轉錄參數建立 DecodingOptions（溫度 > 0 時取樣 best_of，否則使用 beam search）"""
+        kwargs = {
+            "task": options.get("task", "transcribe"),
+            "language": options.get("language"),
+            "temperature": temperature,
+            "fp16": options.get("fp16", True),
+            "prompt": options.get("initial_prompt"),
+        }
+        if temperature > 0:
+            kwargs["best_of"] = options.get("best_of")
+        else:
+            kwargs["beam_size"] = options.get("beam_size")
+        return whisper.DecodingOptions(**kwargs)
+    
+    @staticmethod
+    def needs_fallback(result, options):
+        """與 Whisper 相同的退階條件：壓縮率過高或信心過低，但判定為靜音時不重試"""
+        compression_threshold = options.get("compression_ratio_threshold")
+        logprob_threshold = options.get("logprob_threshold")
+        no_speech_threshold = options.get("no_speech_threshold")
+        
+        needs = False
+        if compression_threshold is not None and result.compression_ratio > compression_threshold:
+            needs = True
+        if logprob_threshold is not None and result.avg_logprob < logprob_threshold:
+            needs = True
+        if no_speech_threshold is not None and result.no_speech_prob > no_speech_threshold:
+            needs = False
+        return needs
+    
+    def add_segments(self, store, result, offset, duration, options):
+        """解析時間戳記 token 並寫入片段，回傳此視窗是否有內容"""
+        no_speech_threshold = options.get("no_speech_threshold")
+        logprob_threshold = options.get("logprob_threshold")
+        if (no_speech_threshold is not None and result.no_speech_prob > no_speech_threshold
+                and (logprob_threshold is None or result.avg_logprob < logprob_threshold)):
+            return False
+        
+        tokens = np.asarray(result.tokens, dtype=np.int64)
+        if len(tokens) == 0:
+            return False
+        
+        timestamp_begin = self.tokenizer.timestamp_begin
+        precision = whisper.audio.CHUNK_LENGTH / self.model.dims.n_audio_ctx
+        metrics = {
+            "avg_logprob": result.avg_logprob,
+            "no_speech_prob": result.no_speech_prob,
+            "compression_ratio": result.compression_ratio,
+        }
+        
+        # 時間戳記 token 兩兩相連處為片段分界；結尾缺少結束時間戳記的文字以視窗結尾為終點
+        is_timestamp = tokens >= timestamp_begin
+        boundaries = np.flatnonzero(is_timestamp[:-1] & is_timestamp[1:]) + 1
+        pieces = np.split(tokens, boundaries)
+        
+        added = False
+        for piece in pieces:
+            stamps = piece[piece >= timestamp_begin]
+            text_tokens = piece[piece < self.tokenizer.eot]
+            text = self.tokenizer.decode(text_tokens.tolist()).strip()
+            if not text:
+                continue
+            start = (stamps[0] - timestamp_begin) * precision if len(stamps) else 0.0
+            end = (stamps[-1] - timestamp_begin) * precision if len(stamps) > 1 else duration
+            start = min(start, duration)
+            end = min(max(end, start), duration)
+            store.append(offset + start, offset + end, text, **metrics)
+            added = True
+        
+        return added
+
+
+class EncoderCache:
+    """重轉用的編碼器輸出快取：同一段音訊只編碼一次，各策略只重跑解碼器
+    
+    以音訊內容的 CRC32 為鍵，主程序與工作程序都能使用；超過 30 秒的片段或需要
+    逐字時間戳記時仍交給 model.transcribe。有 MelFrontend 時直接切出整檔的 log-mel。
+    """
+    
+    def __init__(self, model, frontend=None, max_entries=16):
+        self.decoder = BatchedDecoder(model, batch_size=1)
+        self.frontend = frontend
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def supports(self, audio, options):
+        return len(audio) <= whisper.audio.N_SAMPLES and not options.get("word_timestamps")
+    
+    def log_mel(self, audio, clip_start):
+        """計算片段的 30 秒 log-mel（片段之後補下限值，與 model.transcribe 相同）"""
+        if self.frontend is None:
+            mel = whisper.log_mel_spectrogram(audio, self.decoder.model.dims.n_mels,
+                                              padding=whisper.audio.N_SAMPLES)
+            return mel[:, :whisper.audio.N_FRAMES]
+        
+        count = len(audio) // whisper.audio.HOP_LENGTH
+        mel = self.frontend.window(clip_start, count)
+        floor = (self.frontend.floor + 4.0) / 4.0
+        return torch.nn.functional.pad(mel, (0, whisper.audio.N_FRAMES - count), value=floor)
+    
+    def features(self, audio, fp16, clip_start=0.0):
+        """取得片段的編碼器輸出（快取命中時不重新編碼）"""
+        key = (len(audio), zlib.crc32(np.ascontiguousarray(audio).tobytes()), bool(fp16))
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        
+        self.misses += 1
+        features = self.decoder.encode(self.log_mel(audio, clip_start).unsqueeze(0), fp16)
+        self.entries[key] = features
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return features
+    
+    def transcribe(self, audio, options, clip_start=0.0):
+        """以快取的編碼結果解碼，回傳與 model.transcribe 相同格式的 {"segments": [...]}"""
+        features = self.features(audio, options.get("fp16", True), clip_start)
+        result = self.decoder.decode_features(features, options)[0]
+        store = SegmentStore()
+        self.decoder.add_segments(store, result, 0.0, len(audio) / whisper.audio.SAMPLE_RATE, options)
+        return {"segments": list(store), "language": result.language}
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def report(self):
+        return f"編碼 {self.misses} 次，重用 {self.hits} 次"
+
+
+# ==========================================
+# 記憶體管理
+# ==========================================
+
+class MemoryManager:
+    """依記憶體水位決定是否執行 gc.collect() 與釋放 CUDA 快取，並統計次數與耗時
+    
+    系統記憶體使用率超過 ram_watermark 才做完整 GC；CUDA 保留量超過 cuda_watermark
+    才呼叫 empty_cache，避免配置器在下一段重新配置。沒有 psutil 時無法得知用量，
+    改為每 fallback_interval 次檢查清理一次。
+    """
+    
+    def __init__(self, ram_watermark=0.8, cuda_watermark=0.8, fallback_interval=8):
+        self.ram_watermark = ram_watermark
+        self.cuda_watermark = cuda_watermark
+        self.fallback_interval = fallback_interval
+        self.checks = 0
+        self.collections = 0
+        self.cuda_releases = 0
+        self.time_spent = 0.0
+        self.peak_rss = 0
+    
+    def ram_usage(self):
+        """回傳系統記憶體使用比例（沒有 psutil 時為 None），並更新本程序 RSS 峰值"""
+        if not PSUTIL_AVAILABLE:
+            return None
+        self.peak_rss = max(self.peak_rss, psutil.Process().memory_info().rss)
+        return psutil.virtual_memory().percent / 100.0
+    
+    def cuda_usage(self):
+        """回傳 CUDA 保留記憶體佔總量的比例（沒有 GPU 時為 None）"""
+        if not torch.cuda.is_available():
+            return None
+        total = torch.cuda.get_device_properties(0).total_memory
+        return torch.cuda.memory_reserved(0) / total if total else None
+    
+    def checkpoint(self, force=False):
+        """檢查記憶體水位，超過時才清理，回傳是否有清理"""
+        self.checks += 1
+        ram = self.ram_usage()
+        cuda = self.cuda_usage()
+        
+        if ram is None:
+            collect = self.checks % self.fallback_interval == 0
+        else:
+            collect = ram >= self.ram_watermark
+        release = cuda is not None and cuda >= self.cuda_watermark
+        if not (force or collect or release):
+            return False
+        
+        start_time = time.time()
+        # 先做 GC 讓已無參照的張量真正釋放，empty_cache 才有效果
+        gc.collect()
+        self.collections += 1
+        if (force or release) and cuda is not None:
+            torch.cuda.empty_cache()
+            self.cuda_releases += 1
+        self.time_spent += time.time() - start_time
+        return True
+    
+    def stats(self):
+        return {
+            "checks": self.checks,
+            "collections": self.collections,
+            "cuda_releases": self.cuda_releases,
+            "time_spent": self.time_spent,
+            "peak_rss": self.peak_rss,
+        }
+    
+    def report(self):
+        """產生統計報告"""
+        text = (f"記憶體檢查 {self.checks} 次：GC {self.collections} 次、"
+                f"釋放 CUDA 快取 {self.cuda_releases} 次，耗時 {self.time_spent:.2f} 秒")
+        if self.peak_rss:
+            text += f"，RSS 峰值 {self.peak_rss / (1024 ** 3):.2f} GB"
+        return text
+
+
+# ==========================================
+# 准入控制（依可用記憶體決定處理方式）
+# ==========================================
+
+def probe_duration(path):
+    """以 ffprobe 取得音檔時長（秒），失敗時回傳 None"""
+    cmd = [ffmpeg_binary("ffprobe"), "-v", "error", "-show_entries", "format=duration",
+           "-of", "default=noprint_wrappers=1:nokey=1", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def format_bytes(n):
+    return f"{n / (1024 ** 3):.1f} GB" if n >= 1024 ** 3 else f"{n / (1024 ** 2):.0f} MB"
+
+
+class AdmissionPlan:
+    """准入控制的決定：轉錄方式、分段長度、是否載入整檔音訊"""
+    
+    def __init__(self, mode, chunk_minutes, load_full_audio=True, streaming=False, reason=""):
+        self.mode = mode  # "direct"、"chunked" 或 "batched"
+        self.chunk_minutes = chunk_minutes
+        self.load_full_audio = load_full_audio
+        self.streaming = streaming
+        self.reason = reason
+
+
+class AdmissionController:
+    """由音檔時長估計解碼後的記憶體用量，與可用記憶體比較後決定處理方式
+    
+    整檔放得下時維持原本依檔案大小的選擇；放不下時改為串流分段（不載入整檔，
+    每段才以 ffmpeg 解碼），並縮短分段長度；連最小分段都放不下時先等待記憶體釋出，
+    逾時後仍以最小分段嘗試，而不是直接載入整檔導致程序被終止。
+    """
+    
+    # 每秒音訊的記憶體用量（位元組）
+    PCM_BYTES_PER_SEC = 16000 * (4 + 2)      # 整檔 16 kHz float32，加上解碼時的 int16 緩衝
+    MEL_BYTES_PER_SEC = 128 * 100 * 4        # 整檔 log-mel（批次解碼）
+    
+    # 模型參數量（百萬），用於估計推論時的工作記憶體
+    MODEL_PARAMS = {"tiny": 39, "base": 74, "small": 244, "medium": 769, "large-v2": 1550, "large-v3": 1550}
+    
+    def __init__(self, safety=0.7, min_chunk_minutes=1, wait_seconds=60, poll_seconds=5):
+        self.safety = safety
+        self.min_chunk_minutes = min_chunk_minutes
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+    
+    @staticmethod
+    def available_memory():
+        """可用系統記憶體（位元組），沒有 psutil 時回傳 None"""
+        if not PSUTIL_AVAILABLE:
+            return None
+        return psutil.virtual_memory().available
+    
+    def working_set(self, model_name, device):
+        """推論時的額外工作記憶體（模型權重已常駐，已反映在可用記憶體中）"""
+        if device != "cpu":
+            return 256 * 1024 ** 2
+        return self.MODEL_PARAMS.get(model_name, 1550) * 1e6 * 4 * 0.25
+    
+    def plan(self, duration, size_mb, model_name, device, max_file_size, chunk_minutes, batched,
+             should_wait=None, on_wait=None):
+        """決定處理方式；should_wait() 為 False 時停止等待，on_wait(需要, 可用) 於每次等待前呼叫"""
+        mode = "batched" if batched else ("chunked" if size_mb > max_file_size else "direct")
+        available = self.available_memory()
+        if duration is None or available is None:
+            return AdmissionPlan(mode, chunk_minutes, reason="無法取得時長或可用記憶體，依檔案大小決定")
+        
+        working = self.working_set(model_name, device)
+        # 整檔只解碼一次，各分段與重轉片段都是它的切片
+        needed = duration * self.PCM_BYTES_PER_SEC + working
+        if mode == "batched":
+            needed += duration * self.MEL_BYTES_PER_SEC
+        
+        budget = available * self.safety
+        if needed <= budget:
+            return AdmissionPlan(mode, chunk_minutes,
+                                 reason=f"預估需要 {format_bytes(needed)}，可用 {format_bytes(available)}")
+        
+        # 串流分段：只有目前這段在記憶體中，放不下時分段長度減半
+        minutes = chunk_minutes
+        while minutes > self.min_chunk_minutes and minutes * 60 * self.PCM_BYTES_PER_SEC + working > budget:
+            minutes = max(self.min_chunk_minutes, minutes // 2)
+        chunk_needed = minutes * 60 * self.PCM_BYTES_PER_SEC + working
+        
+        waited = 0
+        while (chunk_needed > available * self.safety and waited < self.wait_seconds
+               and (should_wait is None or should_wait())):
+            if on_wait:
+                on_wait(chunk_needed, available)
+            time.sleep(self.poll_seconds)
+            waited += self.poll_seconds
+            available = self.available_memory()
+        
+        reason = (f"整檔需要 {format_bytes(needed)}，超過可用 {format_bytes(budget)}，"
+                  f"改為串流分段（每 {minutes} 分鐘）")
+        if chunk_needed > available * self.safety:
+            reason += "；記憶體仍不足，以最小分段嘗試"
+        return AdmissionPlan("chunked", minutes, load_full_audio=False, streaming=True, reason=reason)
+
+
+# ==========================================
+# 串流輸出（每完成一段就寫入 SRT/TXT）
+# ==========================================
+
+def format_srt_time(seconds):
+    """格式化 SRT 時間"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millis = int((seconds - int(seconds)) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+class StreamingTranscriptWriter:
+    """分段轉錄時，每完成一段就把已確定的片段附加到 .srt/.txt，讓使用者可以邊轉邊看
+    
+    各段可能不依序完成，會先依序號排好再處理。下一段從本段結束前 overlap_seconds 秒開始，
+    結束時間早於下一段開頭的片段在本段完成時就已確定，只有落入重疊區的片段要等下一段
+    完成、接縫對齊之後才算確定。後處理採滑動視窗：最後 window_seconds 秒的片段先不寫出，
+    之後和下一段一起重新後處理，這樣跨段的重複與短片段也能合併。
+    寫入期間會另外保留 .partial 標記檔，等完整結果（含重轉與後處理）覆寫後才刪除。
+    """
+    
+    def __init__(self, base_path, total_chunks, write_txt=True, write_srt=True,
+                 post_process=None, window_seconds=30.0, overlap_seconds=0.0):
+        self.total_chunks = total_chunks
+        self.post_process = post_process
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        self.marker_path = base_path + ".partial"
+        self.txt = open(base_path + ".txt", "w", encoding="utf-8") if write_txt else None
+        self.srt = open(base_path + ".srt", "w", encoding="utf-8") if write_srt else None
+        self.srt_index = 0
+        self.written = 0
+        self.written_until = 0.0
+        self.chunks_done = 0
+        self._waiting = {}
+        self._next_index = 1
+        self._previous = None
+        self._pending = SegmentStore()
+        self.update_marker()
+    
+    def add_chunk(self, index, start, end, segments):
+        """加入第 index 段（從 1 起算）的結果"""
+        # 接縫對齊會修改文字，先複製一份，不影響最後的完整拼接
+        self._waiting[index] = (start, end, segments.select(np.arange(len(segments))))
+        while self._next_index in self._waiting:
+            self._accept(*self._waiting.pop(self._next_index))
+            self._next_index += 1
+        self.chunks_done += 1
+        self.update_marker()
+    
+    def _accept(self, start, end, store):
+        keep = np.ones(len(store), dtype=bool)
+        if self._previous is not None:
+            prev_end, prev_store, prev_keep = self._previous
+            if start < prev_end:
+                stitch_chunk_pair(prev_store, prev_keep, store, keep, start, prev_end)
+            self._pending.extend_store(prev_store.select(prev_keep))
+        
+        # 結束時間不晚於下一段開頭的片段不會再被接縫對齊修改，先交給後處理
+        next_start = end - self.overlap_seconds
+        settled = keep & (np.cumprod(store.end <= next_start) > 0)
+        self._pending.extend_store(store.select(settled))
+        self._previous = (end, store, keep & ~settled)
+        self._flush(next_start - self.window_seconds)
+    
+    def _flush(self, cutoff=None):
+        """後處理暫存的片段，寫出結束時間不晚於 cutoff 的部分（None 表示全部寫出）"""
+        if len(self._pending) == 0:
+            return
+        pending = self.post_process(self._pending) if self.post_process else self._pending
+        if cutoff is None:
+            count = len(pending)
+        else:
+            count = int(np.cumprod(pending.end <= cutoff).sum())
+        self._write(pending.select(np.arange(count)))
+        self._pending = pending.select(np.arange(count, len(pending)))
+    
+    def _write(self, segments):
+        if len(segments) == 0:
+            return
+        texts = segments.texts()
+        if self.srt:
+            for seg_start, seg_end, text in zip(segments.start.tolist(), segments.end.tolist(), texts):
+                self.srt_index += 1
+                self.srt.write(f"{self.srt_index}\n")
+                self.srt.write(f"{format_srt_time(seg_start)} --> {format_srt_time(seg_end)}\n")
+                self.srt.write(f"{text.strip()}\n\n")
+            self.srt.flush()
+        if self.txt:
+            text = " ".join(t for t in texts if t)
+            if text:
+                self.txt.write((" " if self.txt.tell() else "") + text)
+                self.txt.flush()
+        self.written += len(segments)
+        self.written_until = float(segments.end[-1])
+    
+    def update_marker(self):
+        """更新 .partial 標記檔（進度資訊）"""
+        try:
+            with open(self.marker_path, "w", encoding="utf-8") as f:
+                json.dump({"chunks_done": self.chunks_done, "chunks_total": self.total_chunks,
+                           "segments_written": self.written, "written_until": self.written_until,
+                           "updated": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+        except OSError:
+            pass
+    
+    def finish(self):
+        """寫出剩餘片段並關閉檔案；中途停止時略過缺少的段，照順序寫出已完成的部分"""
+        for index in sorted(self._waiting):
+            self._accept(*self._waiting.pop(index))
+        if self._previous is not None:
+            _, prev_store, prev_keep = self._previous
+            self._pending.extend_store(prev_store.select(prev_keep))
+            self._previous = None
+        self._flush()
+        self.update_marker()
+        for f in (self.txt, self.srt):
+            if f:
+                f.close()
+        self.txt = self.srt = None
+
+
+# ==========================================
+# 機器可讀輸出（JSON / JSONL / Parquet）
+# ==========================================
+
+# 每批取出的片段數（欄位轉為 list 後逐筆寫出，不建立整份文件）
+EXPORT_BATCH_SIZE = 10000
+EXPORT_STRATEGY_KEYS = RETRY_STRATEGIES + ("draft_refine",)
+
+
+def unclear_reason_keys(mask):
+    """將位元遮罩轉為原因代碼清單"""
+    return [key for flag, key in UNCLEAR_REASON_KEYS if mask & flag]
+
+
+def iter_segment_batches(segments, batch_size=EXPORT_BATCH_SIZE):
+    """依批次取出片段欄位，回傳 (起始索引, {欄位: list}, 文字 list)"""
+    for first in range(0, len(segments), batch_size):
+        last = min(first + batch_size, len(segments))
+        columns = {name: getattr(segments, name)[first:last].tolist() for name in SegmentStore.FLOAT_COLUMNS}
+        yield first, columns, segments.texts(first, last)
+
+
+def iter_segment_records(segments, include_words=False):
+    """逐一產生片段的輸出 dict：時間、文字、Whisper 指標、語意不明原因與重轉紀錄"""
+    for first, columns, texts in iter_segment_batches(segments):
+        for k, text in enumerate(texts):
+            strategy = int(columns["retry_strategy"][k])
+            record = {
+                "index": first + k,
+                "start": round(columns["start"][k], 3),
+                "end": round(columns["end"][k], 3),
+                "text": text,
+                "avg_logprob": columns["avg_logprob"][k],
+                "no_speech_prob": columns["no_speech_prob"][k],
+                "compression_ratio": columns["compression_ratio"][k],
+                "unclear": unclear_reason_keys(int(columns["unclear_mask"][k])),
+                "retry": {
+                    "attempts": int(columns["retry_attempts"][k]),
+                    "seconds": round(columns["retry_seconds"][k], 3),
+                    "strategy": EXPORT_STRATEGY_KEYS[strategy] if strategy >= 0 else None,
+                },
+            }
+            if include_words:
+                record["words"] = [{"word": w["word"], "start": round(w["start"], 3), "end": round(w["end"], 3),
+                                    "probability": w["probability"]} for w in segments.row_words(first + k)]
+            yield record
+
+
+def write_json_transcript(path, header, segments, include_words=False):
+    """寫出單一 JSON 文件（檔案資訊加 segments 陣列），片段逐筆寫入"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header, ensure_ascii=False)[:-1])
+        f.write(', "segments": [')
+        separator = "\n"
+        for record in iter_segment_records(segments, include_words):
+            f.write(separator)
+            f.write(json.dumps(record, ensure_ascii=False))
+            separator = ",\n"
+        f.write("\n]}\n")
+
+
+def write_jsonl_transcript(path, header, segments, include_words=False):
+    """寫出 JSONL：第一行為檔案資訊（type=file），其後每行一個片段（type=segment）"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(dict(type="file", **header), ensure_ascii=False))
+        f.write("\n")
+        for record in iter_segment_records(segments, include_words):
+            f.write(json.dumps(dict(type="segment", **record), ensure_ascii=False))
+            f.write("\n")
+
+
+def write_parquet_transcript(path, header, segments):
+    """寫出 Parquet（需要 pyarrow），每批片段寫成一個 row group，檔案資訊存於 schema metadata"""
+    pa = timed_import("pyarrow")
+    pq = timed_import("pyarrow.parquet")
+    schema = pa.schema([
+        ("index", pa.int64()),
+        ("start", pa.float64()),
+        ("end", pa.float64()),
+        ("text", pa.string()),
+        ("avg_logprob", pa.float64()),
+        ("no_speech_prob", pa.float64()),
+        ("compression_ratio", pa.float64()),
+        ("unclear_mask", pa.int32()),
+        ("unclear", pa.list_(pa.string())),
+        ("retry_attempts", pa.int32()),
+        ("retry_seconds", pa.float64()),
+        ("retry_strategy", pa.string()),
+    ], metadata={"audiototexts": json.dumps(header, ensure_ascii=False)})
+    
+    with pq.ParquetWriter(path, schema) as writer:
+        for first, columns, texts in iter_segment_batches(segments):
+            masks = [int(m) for m in columns["unclear_mask"]]
+            strategies = [EXPORT_STRATEGY_KEYS[int(s)] if s >= 0 else None for s in columns["retry_strategy"]]
+            arrays = [
+                pa.array(range(first, first + len(texts)), pa.int64()),
+                pa.array(columns["start"], pa.float64()),
+                pa.array(columns["end"], pa.float64()),
+                pa.array(texts, pa.string()),
+                pa.array(columns["avg_logprob"], pa.float64()),
+                pa.array(columns["no_speech_prob"], pa.float64()),
+                pa.array(columns["compression_ratio"], pa.float64()),
+                pa.array(masks, pa.int32()),
+                pa.array([unclear_reason_keys(m) for m in masks], pa.list_(pa.string())),
+                pa.array([int(a) for a in columns["retry_attempts"]], pa.int32()),
+                pa.array(columns["retry_seconds"], pa.float64()),
+                pa.array(strategies, pa.string()),
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+
+# ==========================================
+# GUI 事件匯流排
+# ==========================================
+
+class GuiEventBus:
+    """背景執行緒送往 GUI 的事件佇列
+    
+    每次更新時合併事件：日誌行一次插入、狀態類事件只保留最新值，並限制單次處理的事件數，
+    避免大量日誌讓 Tk 凍結。完整日誌由 StructuredLog 寫入檔案，介面只保留最近的行數。
+    """
+    
+    # 只需顯示最新值的事件
+    LATEST_ONLY = ('status', 'retry_stats', 'progress', 'current_file')
+    
+    def __init__(self, max_events_per_tick=1000, max_log_lines=2000):
+        self.queue = queue.Queue()
+        self.max_events_per_tick = max_events_per_tick
+        self.max_log_lines = max_log_lines
+    
+    def put(self, event):
+        self.queue.put(event)
+    
+    def drain(self):
+        """取出本次要處理的事件，回傳 (日誌行, {類型: 最新事件}, 其他事件, 是否還有剩餘)"""
+        lines = []
+        latest = {}
+        others = []
+        for _ in range(self.max_events_per_tick):
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            kind = event.get('type')
+            if kind == 'log':
+                lines.append(event['msg'])
+            elif kind in self.LATEST_ONLY:
+                latest[kind] = event
+            else:
+                others.append(event)
+        
+        return lines, latest, others, not self.queue.empty()
+
+
+# ==========================================
+# 結構化日誌（JSONL，背景寫入並依大小輪替）
+# ==========================================
+
+class JsonlFormatter(logging.Formatter):
+    """將日誌紀錄格式化為一行 JSON"""
+    
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredLog:
+    """以 QueueHandler／QueueListener 在背景執行緒寫入 JSONL 日誌，檔案超過大小時輪替"""
+    
+    FILENAME = "audiototexts_log.jsonl"
+    
+    def __init__(self, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.logger = logging.getLogger("audiototexts")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.listener = None
+        self.path = None
+    
+    def start(self, folder):
+        """開始寫入 folder 下的日誌檔"""
+        self.stop()
+        self.path = os.path.join(folder, self.FILENAME)
+        file_handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8")
+        file_handler.setFormatter(JsonlFormatter())
+        
+        log_queue = queue.Queue()
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = logging.handlers.QueueListener(log_queue, file_handler)
+        self.listener.start()
+    
+    def stop(self):
+        """寫完佇列中的紀錄並關閉檔案"""
+        if self.listener is None:
+            return
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+    
+    def event(self, name, **fields):
+        """寫入一筆事件（未啟動時忽略）"""
+        if self.listener is not None:
+            self.logger.info(name, extra={"fields": fields})
 
 
 class WhisperTranscriberV5:
@@ -48,65 +2586,74 @@ class WhisperTranscriberV5:
         self.model_size = StringVar(value="large-v3")
         self.transcribe_mode = StringVar(value="balanced")
         self.use_gpu = BooleanVar(value=True)
+        self.cpu_workers = IntVar(value=1)
+        self.batched_decoding = BooleanVar(value=False)
+        self.decode_batch_size = IntVar(value=8)
+        self.two_pass_mode = BooleanVar(value=False)
         
         # 輸出格式
         self.output_txt = BooleanVar(value=True)
         self.output_srt = BooleanVar(value=True)
         self.output_md = BooleanVar(value=True)
+        self.word_timestamps = BooleanVar(value=False)
+        self.stream_output = BooleanVar(value=True)
+        self.output_json = BooleanVar(value=False)
+        self.output_jsonl = BooleanVar(value=False)
+        self.output_parquet = BooleanVar(value=False)
         
         # 智慧重轉設定
         self.auto_retry_unclear = BooleanVar(value=True)
         self.confidence_threshold = DoubleVar(value=-0.8)
         self.max_retry_attempts = IntVar(value=3)
+        self.retry_budget_ratio = DoubleVar(value=0.5)
+        self.draft_model_size = StringVar(value="none")
         
         # 後處理設定
         self.merge_short_segments = BooleanVar(value=True)
         self.remove_duplicates = BooleanVar(value=True)
+        self.remove_near_duplicates = BooleanVar(value=True)
+        self.near_duplicate_threshold = DoubleVar(value=0.8)
         self.min_segment_length = DoubleVar(value=2.0)
         
         # 大檔案處理
         self.max_file_size = IntVar(value=100)
         self.chunk_length = IntVar(value=5)
+        self.memory_watermark = IntVar(value=80)
         
         # 狀態變數
         self.is_processing = False
         self.model = None
+        self.model_name = None
+        self.draft_model = None
         self.audio_files = []
         self.full_audio = None
-        self.temp_dir = os.path.join(os.getcwd(), "temp_chunks")
+        self.mel_frontend = None
+        self.retry_scheduler = None
+        self.strategy_history = None
+        self.worker_pool = None
+        self.worker_pool_size = 0
+        self.worker_pool_model = None
+        self.memory = MemoryManager()
+        self.admission = AdmissionController()
+        self.audio_file = None
+        self.audio_duration = 0.0
         
         # 執行緒安全佇列
-        self.gui_queue = queue.Queue()
+        self.gui_queue = GuiEventBus()
+        self.structured_log = StructuredLog()
+        self.current_audio_file = None
         
         # 支援的音訊格式
         self.audio_extensions = {'.mp3', '.wav', '.m4a', '.flac', '.aac', '.ogg', '.wma', '.opus', '.webm'}
         
-        # 檢查 GPU
-        self.gpu_available = torch.cuda.is_available()
-        if self.gpu_available:
-            gpu_name = torch.cuda.get_device_name(0)
-            gpu_mem = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-            self.gpu_info = f"✅ {gpu_name} ({gpu_mem:.1f} GB)"
-        else:
-            self.gpu_info = "❌ 無可用 GPU，將使用 CPU（速度較慢）"
-            self.use_gpu.set(False)
-        
-        # 檢查 ffmpeg/ffprobe
-        self.ffmpeg_ok, self.ffprobe_ok = self.check_ffmpeg_components()
-        
-        # 語意不明的判斷模式
-        self.unclear_patterns = [
-            # 中日文不自然混合（日文語法 + 簡體中文）
-            r'[ぁ-んァ-ン][们这那什么怎样][ぁ-んァ-ン]',
-            # 重複字元過多
-            r'(.)\1{4,}',
-            # 奇怪的標點組合
-            r'[。、]{3,}',
-            # 純數字或符號（可能是亂碼）
-            r'^[\d\s\.\,\-]+$',
-            # 日文助詞後接簡體中文
-            r'[はがをにでと][们这那什]',
-        ]
+        # GPU 與 ffmpeg/ffprobe 於背景檢查，視窗先顯示
+        self.gpu_available = False
+        self.gpu_info = "⏳ 檢查中..."
+        self.ffmpeg_ok = False
+        self.ffprobe_ok = False
+        self.ffmpeg_info = FFmpegInfo()
+        self.environment_ready = threading.Event()
+        self.startup_times = {}
         
         # 設定介面樣式
         style = ttk.Style()
@@ -115,45 +2662,54 @@ class WhisperTranscriberV5:
         # 建立介面
         self.setup_ui()
         self.process_gui_queue()
+        self.root.after(0, self.record_first_paint)
+        threading.Thread(target=self.probe_environment, daemon=True).start()
     
-    def check_ffmpeg_components(self):
-        """檢查 ffmpeg 和 ffprobe"""
-        ffmpeg_ok = False
-        ffprobe_ok = False
-        
-        # 檢查當前目錄
-        current_dir = os.getcwd()
-        
-        if os.path.exists(os.path.join(current_dir, "ffmpeg.exe")):
-            ffmpeg_ok = True
-            os.environ['PATH'] = current_dir + os.pathsep + os.environ.get('PATH', '')
-        
-        if os.path.exists(os.path.join(current_dir, "ffprobe.exe")):
-            ffprobe_ok = True
+    def record_first_paint(self):
+        """記錄視窗第一次顯示的時間"""
+        self.startup_times["視窗顯示"] = time.perf_counter() - _STARTUP_T0
+    
+    def probe_environment(self):
+        """背景檢查執行環境：偵測 CUDA、ffmpeg，並預先匯入 PyAV 與 whisper"""
+        global PYAV_AVAILABLE
         
-        # 檢查系統 PATH
+        start = time.perf_counter()
         try:
-            result = subprocess.run(['where', 'ffmpeg'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                ffmpeg_ok = True
-                ffmpeg_path = result.stdout.strip().split('\n')[0]
-                ffmpeg_dir = os.path.dirname(ffmpeg_path)
-                os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ.get('PATH', '')
-                
-                # 檢查同目錄是否有 ffprobe
-                if os.path.exists(os.path.join(ffmpeg_dir, 'ffprobe.exe')):
-                    ffprobe_ok = True
-        except:
-            pass
+            gpu_available = torch.cuda.is_available()
+            if gpu_available:
+                gpu_name = torch.cuda.get_device_name(0)
+                gpu_mem = torch.cuda.get_device_properties(0).total_memory / (1024**3)
+                gpu_info = f"✅ {gpu_name} ({gpu_mem:.1f} GB)"
+            else:
+                gpu_info = "❌ 無可用 GPU，將使用 CPU（速度較慢）"
+        except Exception as e:
+            gpu_available = False
+            gpu_info = f"❌ 無法載入 torch：{e}"
+        self.startup_times["CUDA 檢查"] = time.perf_counter() - start
         
-        try:
-            result = subprocess.run(['where', 'ffprobe'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                ffprobe_ok = True
-        except:
-            pass
+        start = time.perf_counter()
+        ffmpeg_ok, ffprobe_ok = self.check_ffmpeg_components()
+        self.startup_times["ffmpeg 偵測"] = time.perf_counter() - start
         
-        return ffmpeg_ok, ffprobe_ok
+        for name in ("av", "whisper"):
+            if name == "av" and not PYAV_AVAILABLE:
+                continue
+            try:
+                timed_import(name)
+            except ImportError as e:
+                if name == "av":
+                    PYAV_AVAILABLE = False
+                self.log(f"⚠️ 無法匯入 {name}：{e}")
+        
+        self.gpu_available, self.gpu_info = gpu_available, gpu_info
+        self.ffmpeg_ok, self.ffprobe_ok = ffmpeg_ok, ffprobe_ok
+        self.environment_ready.set()
+        self.gui_queue.put({'type': 'environment'})
+    
+    def check_ffmpeg_components(self):
+        """檢查 ffmpeg 和 ffprobe（跨平台，版本與解碼器資訊有快取）"""
+        self.ffmpeg_info = discover_ffmpeg()
+        return bool(self.ffmpeg_info.ffmpeg), bool(self.ffmpeg_info.ffprobe)
     
     def setup_ui(self):
         """建立使用者介面"""
@@ -188,42 +2744,19 @@ class WhisperTranscriberV5:
         status_frame.grid(row=row, column=0, sticky=(W, E), pady=5)
         row += 1
         
-        # GPU 狀態
-        gpu_color = "green" if self.gpu_available else "red"
-        ttk.Label(status_frame, text=f"GPU：{self.gpu_info}", 
-                 foreground=gpu_color).grid(row=0, column=0, sticky=W)
-        
-        # FFmpeg 狀態
-        if self.ffmpeg_ok:
-            ffmpeg_text = "✅ FFmpeg：已找到"
-            ffmpeg_color = "green"
-        else:
-            ffmpeg_text = "❌ FFmpeg：未找到"
-            ffmpeg_color = "red"
-        ttk.Label(status_frame, text=ffmpeg_text, foreground=ffmpeg_color).grid(row=1, column=0, sticky=W)
-        
-        # FFprobe 狀態
-        if self.ffprobe_ok:
-            ffprobe_text = "✅ FFprobe：已找到"
-            ffprobe_color = "green"
-        else:
-            ffprobe_text = "⚠️ FFprobe：未找到（大檔案分段功能可能受限）"
-            ffprobe_color = "orange"
-        ttk.Label(status_frame, text=ffprobe_text, foreground=ffprobe_color).grid(row=2, column=0, sticky=W)
-        
-        # pydub 狀態
-        if PYDUB_AVAILABLE:
-            pydub_text = "✅ PyDub：已安裝"
-            pydub_color = "green"
-        else:
-            pydub_text = "⚠️ PyDub：未安裝（智慧重轉功能受限）"
-            pydub_color = "orange"
-        ttk.Label(status_frame, text=pydub_text, foreground=pydub_color).grid(row=3, column=0, sticky=W)
+        # GPU、FFmpeg、FFprobe、解碼器狀態（背景檢查完成後更新）
+        self.gpu_status_label = ttk.Label(status_frame, text=f"GPU：{self.gpu_info}", foreground="gray")
+        self.gpu_status_label.grid(row=0, column=0, sticky=W)
+        self.ffmpeg_status_label = ttk.Label(status_frame, text="⏳ FFmpeg：檢查中...", foreground="gray")
+        self.ffmpeg_status_label.grid(row=1, column=0, sticky=W)
+        self.ffprobe_status_label = ttk.Label(status_frame, text="⏳ FFprobe：檢查中...", foreground="gray")
+        self.ffprobe_status_label.grid(row=2, column=0, sticky=W)
+        self.decoder_status_label = ttk.Label(status_frame, text="⏳ 解碼器：檢查中...", foreground="gray")
+        self.decoder_status_label.grid(row=3, column=0, sticky=W)
         
-        if not self.ffprobe_ok or not PYDUB_AVAILABLE:
-            ttk.Label(status_frame, 
-                     text="   💡 提示：請將 ffmpeg.exe 和 ffprobe.exe 放到程式資料夾", 
-                     foreground="gray", font=('', 8)).grid(row=4, column=0, sticky=W)
+        self.ffmpeg_hint_label = ttk.Label(status_frame, 
+                                           text="   💡 提示：請將 ffmpeg 和 ffprobe 放到程式資料夾、系統 PATH，或設定 AUDIOTOTEXTS_FFMPEG_DIR", 
+                                           foreground="gray", font=('', 8))
         
         # ==================== 2. 檔案選擇 ====================
         file_frame = ttk.LabelFrame(self.scrollable_frame, text="📁 檔案設定", padding="10")
@@ -281,9 +2814,29 @@ class WhisperTranscriberV5:
         gpu_frame = ttk.Frame(model_frame)
         gpu_frame.grid(row=1, column=0, columnspan=2, sticky=W, pady=(15, 0))
         
-        ttk.Checkbutton(gpu_frame, text="使用 GPU 加速（大幅提升速度）", 
-                       variable=self.use_gpu,
-                       state="normal" if self.gpu_available else "disabled").grid(row=0, column=0, sticky=W)
+        self.gpu_check = ttk.Checkbutton(gpu_frame, text="使用 GPU 加速（大幅提升速度）", 
+                                         variable=self.use_gpu, state="disabled")
+        self.gpu_check.grid(row=0, column=0, sticky=W)
+        
+        workers_frame = ttk.Frame(gpu_frame)
+        workers_frame.grid(row=1, column=0, sticky=W, pady=(5, 0))
+        ttk.Label(workers_frame, text="CPU 平行程序數：").grid(row=0, column=0, sticky=W)
+        ttk.Spinbox(workers_frame, from_=1, to=max(1, os.cpu_count() or 1), increment=1,
+                   textvariable=self.cpu_workers, width=5).grid(row=0, column=1, padx=5)
+        ttk.Label(workers_frame, text="（分段轉錄與重轉共用，每個程序各載入一份模型）",
+                 foreground="gray").grid(row=0, column=2, sticky=W)
+        
+        batch_frame = ttk.Frame(gpu_frame)
+        batch_frame.grid(row=2, column=0, sticky=W, pady=(5, 0))
+        ttk.Checkbutton(batch_frame, text="批次解碼：每批",
+                       variable=self.batched_decoding).grid(row=0, column=0, sticky=W)
+        ttk.Spinbox(batch_frame, from_=1, to=32, increment=1,
+                   textvariable=self.decode_batch_size, width=5).grid(row=0, column=1, padx=5)
+        ttk.Label(batch_frame, text="個 30 秒視窗一起編碼解碼（較快，但不產生逐字時間戳記）",
+                 foreground="gray").grid(row=0, column=2, sticky=W)
+        
+        ttk.Checkbutton(gpu_frame, text="兩階段模式：先以小模型產生整批草稿，再以大模型精修不清楚的片段",
+                       variable=self.two_pass_mode).grid(row=3, column=0, sticky=W, pady=(5, 0))
         
         # ==================== 4. 智慧重轉設定 ====================
         retry_frame = ttk.LabelFrame(self.scrollable_frame, text="🔄 智慧重轉設定（語意不明自動重試）", padding="10")
@@ -319,6 +2872,20 @@ class WhisperTranscriberV5:
                    textvariable=self.max_retry_attempts, width=6).grid(row=1, column=1, padx=5, pady=(5, 0))
         ttk.Label(param_frame, text="次").grid(row=1, column=2, pady=(5, 0))
         
+        ttk.Label(param_frame, text="重轉時間預算：").grid(row=2, column=0, pady=(5, 0))
+        ttk.Spinbox(param_frame, from_=0, to=3.0, increment=0.1,
+                   textvariable=self.retry_budget_ratio, width=6).grid(row=2, column=1, padx=5, pady=(5, 0))
+        ttk.Label(param_frame, text="倍音檔時長（0 = 不限制）").grid(row=2, column=2, pady=(5, 0))
+        
+        ttk.Label(param_frame, text="小模型初篩：").grid(row=3, column=0, pady=(5, 0))
+        draft_frame = ttk.Frame(param_frame)
+        draft_frame.grid(row=3, column=1, columnspan=2, sticky=W, pady=(5, 0))
+        for i, (text, value) in enumerate([("不使用", "none"), ("tiny", "tiny"), ("base", "base")]):
+            ttk.Radiobutton(draft_frame, text=text, variable=self.draft_model_size,
+                           value=value).grid(row=0, column=i, sticky=W, padx=(5, 0))
+        ttk.Label(draft_frame, text="（先以小模型篩選，只有仍不清楚的片段才交給大模型）",
+                 foreground="gray").grid(row=0, column=3, sticky=W, padx=(5, 0))
+        
         # ==================== 5. 後處理與輸出設定 ====================
         output_frame = ttk.LabelFrame(self.scrollable_frame, text="📄 後處理與輸出設定", padding="10")
         output_frame.grid(row=row, column=0, sticky=(W, E), pady=5)
@@ -333,6 +2900,13 @@ class WhisperTranscriberV5:
         ttk.Checkbutton(post_frame, text="移除重複內容",
                        variable=self.remove_duplicates).grid(row=0, column=1, sticky=W, padx=(20, 0))
         
+        near_frame = ttk.Frame(post_frame)
+        near_frame.grid(row=1, column=0, columnspan=2, sticky=W, pady=(5, 0))
+        ttk.Checkbutton(near_frame, text="移除近似重複，相似度 ≥",
+                       variable=self.remove_near_duplicates).grid(row=0, column=0, sticky=W)
+        ttk.Spinbox(near_frame, from_=0.5, to=1.0, increment=0.05,
+                   textvariable=self.near_duplicate_threshold, width=5).grid(row=0, column=1, padx=5)
+        
         # 輸出格式
         format_frame = ttk.Frame(output_frame)
         format_frame.grid(row=1, column=0, sticky=W, pady=(10, 0))
@@ -344,6 +2918,17 @@ class WhisperTranscriberV5:
                        variable=self.output_srt).grid(row=0, column=2, sticky=W, padx=(10, 0))
         ttk.Checkbutton(format_frame, text="MD（含時間戳記）", 
                        variable=self.output_md).grid(row=0, column=3, sticky=W, padx=(10, 0))
+        ttk.Checkbutton(format_frame, text="逐字時間戳記（另存 .words.srt）", 
+                       variable=self.word_timestamps).grid(row=1, column=1, columnspan=3, sticky=W, padx=(10, 0))
+        ttk.Checkbutton(format_frame, text="分段完成即寫入 TXT/SRT（大檔案可邊轉邊看）", 
+                       variable=self.stream_output).grid(row=2, column=1, columnspan=3, sticky=W, padx=(10, 0))
+        ttk.Checkbutton(format_frame, text="JSON（含片段指標）", 
+                       variable=self.output_json).grid(row=3, column=1, sticky=W, padx=(10, 0))
+        ttk.Checkbutton(format_frame, text="JSONL", 
+                       variable=self.output_jsonl).grid(row=3, column=2, sticky=W, padx=(10, 0))
+        ttk.Checkbutton(format_frame, text="Parquet" if PYARROW_AVAILABLE else "Parquet（需安裝 pyarrow）", 
+                       variable=self.output_parquet,
+                       state="normal" if PYARROW_AVAILABLE else "disabled").grid(row=3, column=3, sticky=W, padx=(10, 0))
         
         # 大檔案分段
         chunk_frame = ttk.Frame(output_frame)
@@ -357,6 +2942,11 @@ class WhisperTranscriberV5:
                    textvariable=self.chunk_length, width=5).grid(row=0, column=3, padx=5)
         ttk.Label(chunk_frame, text="分鐘切一段").grid(row=0, column=4)
         
+        ttk.Label(chunk_frame, text="記憶體用量超過").grid(row=1, column=0, sticky=W, pady=(5, 0))
+        ttk.Spinbox(chunk_frame, from_=50, to=95, increment=5,
+                   textvariable=self.memory_watermark, width=6).grid(row=1, column=1, padx=5, pady=(5, 0))
+        ttk.Label(chunk_frame, text="% 時才清理（RAM 與 GPU）").grid(row=1, column=2, columnspan=3, sticky=W, pady=(5, 0))
+        
         # ==================== 6. 進度顯示 ====================
         progress_frame = ttk.LabelFrame(self.scrollable_frame, text="⏳ 處理進度", padding="10")
         progress_frame.grid(row=row, column=0, sticky=(W, E), pady=5)
@@ -406,72 +2996,123 @@ class WhisperTranscriberV5:
                                    state='disabled', width=18)
         self.stop_btn.grid(row=0, column=1, padx=8)
         
-        ttk.Button(btn_frame, text="📂 開啟輸出資料夾", 
-                  command=self.open_output_folder, width=18).grid(row=0, column=2, padx=8)
+        ttk.Button(btn_frame, text="📂 開啟輸出資料夾", 
+                  command=self.open_output_folder, width=18).grid(row=0, column=2, padx=8)
+        
+        # 更新捲軸區域
+        self.root.update()
+        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        
+        # 顯示初始日誌
+        self.log("=" * 55)
+        self.log("🎙️🐰 音檔轉錄小兔歐 V5.1 已啟動")
+        self.log("=" * 55)
+        self.log("⏳ 正在背景檢查 GPU 與 FFmpeg...")
+    
+    def show_environment_status(self):
+        """背景檢查完成後更新系統狀態區與日誌"""
+        self.gpu_status_label.config(text=f"GPU：{self.gpu_info}",
+                                     foreground="green" if self.gpu_available else "red")
+        if self.gpu_available:
+            self.gpu_check.config(state="normal")
+        else:
+            self.use_gpu.set(False)
+        
+        if self.ffmpeg_ok:
+            self.ffmpeg_status_label.config(text="✅ FFmpeg：已找到", foreground="green")
+        else:
+            self.ffmpeg_status_label.config(text="❌ FFmpeg：未找到", foreground="red")
+        
+        if self.ffprobe_ok:
+            self.ffprobe_status_label.config(text="✅ FFprobe：已找到", foreground="green")
+        else:
+            self.ffprobe_status_label.config(text="⚠️ FFprobe：未找到（大檔案分段功能可能受限）", foreground="orange")
+        
+        if PYAV_AVAILABLE:
+            self.decoder_status_label.config(text="✅ 解碼器：PyAV（程序內解碼）", foreground="green")
+        else:
+            self.decoder_status_label.config(text="ℹ️ 解碼器：ffmpeg 管線（安裝 av 套件可加快片段擷取）",
+                                             foreground="orange")
         
-        # 更新捲軸區域
-        self.root.update()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        if not self.ffmpeg_ok or not self.ffprobe_ok:
+            self.ffmpeg_hint_label.grid(row=4, column=0, sticky=W)
         
-        # 顯示初始日誌
-        self.log("=" * 55)
-        self.log("🎙️🐰 音檔轉錄小兔歐 V5.1 已啟動")
-        self.log("=" * 55)
         self.log(f"GPU：{'可用 ✅' if self.gpu_available else '不可用 ❌'}")
         self.log(f"FFmpeg：{'已找到 ✅' if self.ffmpeg_ok else '未找到 ❌'}")
+        if self.ffmpeg_ok:
+            self.log(f"   {self.ffmpeg_info.summary()}")
         self.log(f"FFprobe：{'已找到 ✅' if self.ffprobe_ok else '未找到 ⚠️'}")
-        self.log(f"PyDub：{'已安裝 ✅' if PYDUB_AVAILABLE else '未安裝 ⚠️'}")
+        self.log(f"解碼器：{get_audio_decoder().backend}")
+        
+        # 啟動耗時：視窗顯示、各模組匯入與背景檢查
+        timings = dict(self.startup_times)
+        timings.update((f"匯入 {name}", seconds) for name, seconds in IMPORT_TIMES.items())
+        self.log("⏱️ 啟動耗時：" + "、".join(f"{name} {seconds:.2f} 秒" for name, seconds in timings.items()))
         self.log("")
 
     # ==================== GUI 輔助方法 ====================
     
     def process_gui_queue(self):
-        """處理 GUI 更新佇列"""
-        try:
-            while True:
-                task = self.gui_queue.get_nowait()
-                task_type = task.get('type')
-                
-                if task_type == 'log':
-                    self.log_text.config(state='normal')
-                    self.log_text.insert(END, task['msg'] + "\n")
-                    self.log_text.see(END)
-                    self.log_text.config(state='disabled')
-                    
-                elif task_type == 'status':
-                    self.status_label.config(text=task['msg'], foreground=task.get('color', 'blue'))
-                    
-                elif task_type == 'retry_stats':
-                    self.retry_stats_label.config(text=task['msg'])
-                    
-                elif task_type == 'progress':
-                    self.overall_label.config(text=f"整體進度：{task['current']} / {task['total']}")
-                    if task['total'] > 0:
-                        self.overall_bar['value'] = (task['current'] / task['total']) * 100
-                        
-                elif task_type == 'current_file':
-                    self.current_label.config(text=f"目前檔案：{task['filename']}")
-                    
-                elif task_type == 'msgbox':
-                    if task['box'] == 'info':
-                        messagebox.showinfo(task['title'], task['msg'])
-                    elif task['box'] == 'error':
-                        messagebox.showerror(task['title'], task['msg'])
-                    elif task['box'] == 'warning':
-                        messagebox.showwarning(task['title'], task['msg'])
-                    elif task['box'] == 'askyesno':
-                        result = messagebox.askyesno(task['title'], task['msg'])
-                        if task.get('callback'):
-                            task['callback'](result)
-                            
-        except queue.Empty:
-            pass
-        
-        self.root.after(100, self.process_gui_queue)
+        """處理 GUI 更新佇列（每次合併同類事件）"""
+        lines, latest, others, backlog = self.gui_queue.drain()
+        
+        if lines:
+            self.log_text.config(state='normal')
+            self.log_text.insert(END, "\n".join(lines) + "\n")
+            # 只保留最近的行數，完整內容在日誌檔
+            line_count = int(self.log_text.index('end-1c').split('.')[0])
+            excess = line_count - self.gui_queue.max_log_lines
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(END)
+            self.log_text.config(state='disabled')
+        
+        task = latest.get('status')
+        if task:
+            self.status_label.config(text=task['msg'], foreground=task.get('color', 'blue'))
+        
+        task = latest.get('retry_stats')
+        if task:
+            self.retry_stats_label.config(text=task['msg'])
+        
+        task = latest.get('progress')
+        if task:
+            self.overall_label.config(text=f"整體進度：{task['current']} / {task['total']}")
+            if task['total'] > 0:
+                self.overall_bar['value'] = (task['current'] / task['total']) * 100
+        
+        task = latest.get('current_file')
+        if task:
+            self.current_label.config(text=f"目前檔案：{task['filename']}")
+        
+        for task in others:
+            if task.get('type') == 'environment':
+                self.show_environment_status()
+            elif task.get('type') == 'msgbox':
+                if task['box'] == 'info':
+                    messagebox.showinfo(task['title'], task['msg'])
+                elif task['box'] == 'error':
+                    messagebox.showerror(task['title'], task['msg'])
+                elif task['box'] == 'warning':
+                    messagebox.showwarning(task['title'], task['msg'])
+                elif task['box'] == 'askyesno':
+                    result = messagebox.askyesno(task['title'], task['msg'])
+                    if task.get('callback'):
+                        task['callback'](result)
+        
+        # 還有積壓的事件時盡快再處理下一批
+        self.root.after(10 if backlog else 100, self.process_gui_queue)
     
     def log(self, msg):
         """寫入日誌"""
         self.gui_queue.put({'type': 'log', 'msg': msg})
+        self.structured_log.event("log", msg=msg)
+    
+    def event(self, name, **fields):
+        """寫入結構化日誌事件（自動附上目前檔案）"""
+        if self.current_audio_file:
+            fields.setdefault("file", os.path.basename(self.current_audio_file))
+        self.structured_log.event(name, **fields)
     
     def status(self, msg, color="blue"):
         """更新狀態"""
@@ -540,68 +3181,24 @@ class WhisperTranscriberV5:
         else:
             self.msgbox('warning', "提示", "輸出資料夾不存在")
     
-    def clear_memory(self):
-        """清理記憶體"""
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+    def clear_memory(self, force=False):
+        """清理記憶體（超過水位或 force 時才實際清理）"""
+        return self.memory.checkpoint(force)
 
     # ==================== 語意不明偵測 ====================
     
     def is_unclear_segment(self, segment):
         """判斷片段是否語意不明"""
-        text = segment.get("text", "").strip()
-        avg_logprob = segment.get("avg_logprob", 0)
-        no_speech_prob = segment.get("no_speech_prob", 0)
-        compression_ratio = segment.get("compression_ratio", 1)
-        
-        reasons = []
-        
-        # 1. 信心度過低
-        if avg_logprob < self.confidence_threshold.get():
-            reasons.append(f"信心度低({avg_logprob:.2f})")
-        
-        # 2. 靜音機率過高
-        if no_speech_prob > 0.7:
-            reasons.append(f"可能是靜音({no_speech_prob:.2f})")
-        
-        # 3. 壓縮比異常（可能是重複/幻覺）
-        if compression_ratio > 2.5:
-            reasons.append(f"壓縮比高({compression_ratio:.2f})")
-        
-        # 4. 文字模式異常
-        for pattern in self.unclear_patterns:
-            if re.search(pattern, text):
-                reasons.append("文字模式異常")
-                break
-        
-        # 5. 中日文不自然混合檢測
-        if self.has_unnatural_mixing(text):
-            reasons.append("中日混合不自然")
-        
-        # 6. 太短且信心度不高
-        if len(text) < 3 and avg_logprob < -0.5:
-            reasons.append("內容過短")
-        
-        return reasons
+        mask = self.score_unclear_segments([segment])[0]
+        return describe_unclear_reasons(mask, segment)
+    
+    def score_unclear_segments(self, segments):
+        """批次判斷整份片段清單，回傳原因位元遮罩陣列"""
+        return score_unclear_segments(segments, self.confidence_threshold.get())
     
     def has_unnatural_mixing(self, text):
         """檢測中日文是否不自然混合"""
-        # 日文假名
-        hiragana = set('ぁあぃいぅうぇえぉおかがきぎくぐけげこごさざしじすずせぜそぞただちぢっつづてでとどなにぬねのはばぱひびぴふぶぷへべぺほぼぽまみむめもゃやゅゆょよらりるれろゎわゐゑをんゔゕゖ')
-        katakana = set('ァアィイゥウェエォオカガキギクグケゲコゴサザシジスズセゼソゾタダチヂッツヅテデトドナニヌネノハバパヒビピフブプヘベペホボポマミムメモャヤュユョヨラリルレロヮワヰヱヲンヴヵヶ')
-        
-        # 簡體中文特有字（不在日文中使用）
-        simplified_only = set('这那里么们该让给对为')
-        
-        has_kana = any(c in hiragana or c in katakana for c in text)
-        has_simplified = any(c in simplified_only for c in text)
-        
-        # 如果同時有假名和簡體中文特有字，很可能是錯誤
-        if has_kana and has_simplified:
-            return True
-        
-        return False
+        return has_unnatural_mixing(text)
 
     # ==================== 核心轉錄邏輯 ====================
     
@@ -617,6 +3214,7 @@ class WhisperTranscriberV5:
             "fp16": fp16,
             "language": None,  # 自動偵測
             "condition_on_previous_text": False,  # 避免錯誤累積
+            "word_timestamps": self.word_timestamps.get(),
         }
         
         # 根據模式設定基礎閾值
@@ -671,6 +3269,7 @@ class WhisperTranscriberV5:
             "fp16": fp16,
             "language": lang,
             "condition_on_previous_text": False,
+            "word_timestamps": self.word_timestamps.get(),
             "temperature": 0.0,
             "no_speech_threshold": 0.3,
             "logprob_threshold": -1.5,
@@ -690,6 +3289,10 @@ class WhisperTranscriberV5:
     def start_transcription(self):
         """開始轉錄"""
         # 驗證
+        if not self.environment_ready.is_set():
+            self.msgbox('info', "請稍候", "正在檢查 GPU 與 FFmpeg，請稍後再按開始。")
+            return
+        
         if not self.audio_files:
             self.msgbox('error', "錯誤", "請先選擇包含音檔的資料夾！")
             return
@@ -737,31 +3340,59 @@ class WhisperTranscriberV5:
         success_count = 0
         fail_count = 0
         total_retries = 0
+        total_retry_time = 0.0
         
         try:
+            # 完整日誌以 JSONL 寫入輸出資料夾，介面只保留最近的部分
+            try:
+                self.structured_log.start(self.output_folder.get())
+            except OSError as e:
+                self.log(f"⚠️ 無法建立日誌檔：{e}")
+            
             self.log("=" * 55)
             self.log("🚀 開始批次轉錄")
             self.log("=" * 55)
             
-            self.clear_memory()
+            watermark = self.memory_watermark.get() / 100.0
+            self.memory = MemoryManager(ram_watermark=watermark, cuda_watermark=watermark)
+            self.clear_memory(force=True)
             
             device = "cuda" if self.use_gpu.get() and self.gpu_available else "cpu"
             self.log(f"💻 使用裝置：{device.upper()}")
             self.log(f"🎚️ 轉錄模式：{self.transcribe_mode.get()}")
             self.log(f"🔄 智慧重轉：{'開啟' if self.auto_retry_unclear.get() else '關閉'}")
+            self.event("run_start", device=device, model=self.model_size.get(),
+                       mode=self.transcribe_mode.get(), files=len(self.audio_files))
+            
+            # 兩階段模式：先以小模型為整批檔案產生草稿
+            drafts = {}
+            if self.two_pass_mode.get():
+                drafts = self.run_draft_pass(device)
+                if not self.is_processing:
+                    return
             
             # 載入模型
             self.status("正在載入模型...", "blue")
             self.log(f"🤖 載入模型：{self.model_size.get()}...")
             
-            load_start = time.time()
-            self.model = whisper.load_model(self.model_size.get(), device=device)
-            load_time = time.time() - load_start
+            self.model_name = self.model_size.get()
+            self.model, load_note = load_whisper_model(self.model_name, device)
             
             if device == "cuda":
                 torch.backends.cudnn.benchmark = True
             
-            self.log(f"   載入完成（耗時 {load_time:.1f} 秒）")
+            self.log(f"   載入完成（{load_note}）")
+            self.event("model_load", model=self.model_name, note=load_note)
+            
+            # 小模型初篩（與大模型同時常駐）
+            draft_size = self.draft_model_size.get()
+            if self.auto_retry_unclear.get() and draft_size != "none":
+                self.draft_model, load_note = load_whisper_model(draft_size, device)
+                self.log(f"🐣 載入初篩模型：{draft_size}（{load_note}）")
+            
+            # 讀取此輸出資料夾的重轉策略成功率
+            self.strategy_history = RetryStrategyHistory(self.output_folder.get())
+            
             self.log("")
             
             total_files = len(self.audio_files)
@@ -779,21 +3410,32 @@ class WhisperTranscriberV5:
                 self.current_file(filename)
                 self.progress(index - 1, total_files)
                 
+                self.retry_scheduler = None
+                self.current_audio_file = audio_file
+                file_start = time.time()
+                self.event("file_start", size_mb=os.path.getsize(audio_file) / (1024 * 1024))
+                
                 try:
-                    retries = self.transcribe_single_file(audio_file, device)
+                    retries = self.transcribe_single_file(audio_file, device, drafts.pop(audio_file, None))
                     total_retries += retries
                     success_count += 1
                     self.log(f"   ✅ 完成")
+                    self.event("file_done", elapsed=time.time() - file_start, retries=retries)
                     
                 except Exception as e:
                     fail_count += 1
                     self.log(f"   ❌ 錯誤：{e}")
                     import traceback
                     self.log(f"   {traceback.format_exc()}")
+                    self.event("file_error", elapsed=time.time() - file_start, error=str(e))
+                
+                if self.retry_scheduler:
+                    total_retry_time += self.retry_scheduler.elapsed
+                self.current_audio_file = None
                 
                 self.clear_memory()
                 self.progress(index, total_files)
-                self.retry_stats(f"累計重轉：{total_retries} 個片段")
+                self.retry_stats(f"累計重轉：{total_retries} 個片段（重轉耗時 {total_retry_time:.0f} 秒）")
             
             # 完成
             self.log("")
@@ -803,7 +3445,11 @@ class WhisperTranscriberV5:
             if fail_count > 0:
                 self.log(f"   ❌ 失敗：{fail_count} 個")
             self.log(f"   🔄 重轉片段：{total_retries} 個")
+            self.log(f"   🧹 {self.memory.report()}")
             self.log("=" * 55)
+            self.event("memory", **self.memory.stats())
+            self.event("run_done", succeeded=success_count, failed=fail_count,
+                       retried_segments=total_retries, retry_time=total_retry_time)
             
             self.status("✅ 轉錄完成！", "green")
             self.current_file("全部完成")
@@ -824,47 +3470,217 @@ class WhisperTranscriberV5:
             
         finally:
             self.is_processing = False
+            self.shutdown_worker_pool()
             self.model = None
+            self.draft_model = None
             self.full_audio = None
-            self.clear_memory()
+            self.mel_frontend = None
+            decoder = get_audio_decoder()
+            if decoder.decode_count:
+                self.log(f"🎧 解碼：{decoder.report()}")
+            decoder.reset()
+            self.clear_memory(force=True)
+            self.current_audio_file = None
+            self.structured_log.stop()
             
             self.root.after(0, lambda: self.start_btn.config(state='normal'))
             self.root.after(0, lambda: self.stop_btn.config(state='disabled'))
             self.root.after(0, lambda: self.current_bar.stop())
     
-    def transcribe_single_file(self, audio_file, device):
-        """轉錄單一檔案，回傳重轉次數"""
-        size_mb = os.path.getsize(audio_file) / (1024 * 1024)
-        self.log(f"   大小：{size_mb:.1f} MB")
+    def run_draft_pass(self, device):
+        """兩階段模式第一階段：以小模型轉錄整批檔案並立即儲存草稿，回傳 {檔案: 草稿結果}"""
+        draft_size = self.draft_model_size.get()
+        if draft_size == "none":
+            draft_size = "base"
+        
+        self.log(f"📝 第一階段：以 {draft_size} 模型產生草稿...")
+        self.status("正在載入草稿模型...", "blue")
+        self.model_name = draft_size
+        self.model, load_note = load_whisper_model(draft_size, device)
+        self.log(f"   草稿模型載入完成（{load_note}）")
+        
+        drafts = {}
+        total_files = len(self.audio_files)
+        pass_start = time.time()
         
-        # 嘗試載入音檔（用於智慧重轉）
-        self.full_audio = None
-        if PYDUB_AVAILABLE and self.ffprobe_ok:
-            try:
-                self.full_audio = AudioSegment.from_file(audio_file)
-            except Exception as e:
-                self.log(f"   ⚠️ 無法載入音檔供重轉使用：{e}")
+        try:
+            for index, audio_file in enumerate(self.audio_files, 1):
+                if not self.is_processing:
+                    self.log("⚠️ 使用者中止處理")
+                    break
+                
+                filename = os.path.basename(audio_file)
+                self.log(f"📝 [{index}/{total_files}] 草稿：{filename}")
+                self.current_file(f"草稿：{filename}")
+                self.progress(index - 1, total_files)
+                
+                try:
+                    result = self.post_process(self.transcribe_file(audio_file, device))
+                    self.save_results(audio_file, result)
+                    drafts[audio_file] = result
+                except Exception as e:
+                    self.log(f"   ❌ 草稿失敗（第二階段將完整轉錄）：{e}")
+                
+                self.clear_memory()
+                self.progress(index, total_files)
+        finally:
+            # 工作程序載入的是草稿模型，第二階段需重建
+            self.shutdown_worker_pool()
+            self.model = None
+            self.model_name = None
+            self.full_audio = None
+            self.mel_frontend = None
+            self.clear_memory(force=True)
         
-        # 轉錄
-        if size_mb > self.max_file_size.get() and self.full_audio:
-            self.log(f"   ✂️ 檔案較大，分段處理...")
-            result = self.transcribe_chunked(audio_file, device)
+        self.log(f"📝 草稿完成：{len(drafts)}/{total_files} 個檔案（耗時 {time.time() - pass_start:.1f} 秒）")
+        self.log("✏️ 第二階段：以大模型精修語意不明的片段")
+        self.log("")
+        return drafts
+    
+    def transcribe_single_file(self, audio_file, device, draft=None):
+        """轉錄單一檔案，回傳重轉次數（有草稿時只精修草稿中語意不明的片段）"""
+        timings = {}
+        stage_start = time.time()
+        if draft is not None:
+            result = self.refine_draft(audio_file, draft, device)
+            stage = "refine"
         else:
-            result = self.transcribe_direct(audio_file, device)
+            result = self.transcribe_file(audio_file, device)
+            stage = "transcribe"
+        timings[stage] = time.time() - stage_start
+        self.event("stage", stage=stage, elapsed=timings[stage],
+                   segments=len(result["segments"]), language=result.get("language"))
         
         # 智慧重轉
         retry_count = 0
-        if self.auto_retry_unclear.get() and self.full_audio:
+        if self.auto_retry_unclear.get() and self.retry_audio_available():
+            stage_start = time.time()
             result, retry_count = self.retry_unclear_segments(result, device)
+            timings["retry"] = time.time() - stage_start
+            self.event("stage", stage="retry", elapsed=timings["retry"], improved=retry_count)
         
         # 後處理
+        stage_start = time.time()
+        before = len(result["segments"])
         result = self.post_process(result)
+        timings["post_process"] = time.time() - stage_start
+        self.event("stage", stage="post_process", elapsed=timings["post_process"],
+                   segments_before=before, segments=len(result["segments"]))
         
         # 儲存
-        self.save_results(audio_file, result)
+        stage_start = time.time()
+        self.save_results(audio_file, result, timings)
+        self.event("stage", stage="save", elapsed=time.time() - stage_start)
         
         return retry_count
     
+    def load_full_audio(self, audio_file):
+        """解碼整個音檔一次，轉錄、分段與智慧重轉都使用這份陣列"""
+        self.full_audio = None
+        self.mel_frontend = None
+        if self.ffmpeg_ok or PYAV_AVAILABLE:
+            try:
+                self.full_audio = get_audio_decoder().decode(audio_file)
+            except Exception as e:
+                self.log(f"   ⚠️ 無法解碼音檔：{e}")
+    
+    def prepare_audio(self, audio_file, device):
+        """依准入控制決定處理方式，並視需要載入整檔音訊，回傳 AdmissionPlan"""
+        size_mb = os.path.getsize(audio_file) / (1024 * 1024)
+        self.log(f"   大小：{size_mb:.1f} MB")
+        
+        duration = probe_duration(audio_file) if self.ffprobe_ok else None
+        
+        def on_wait(needed, available):
+            self.log(f"   ⏳ 記憶體不足（需要 {format_bytes(needed)}，可用 {format_bytes(available)}），等待釋出...")
+        
+        plan = self.admission.plan(duration, size_mb, self.model_name, device,
+                                   self.max_file_size.get(), self.chunk_length.get(),
+                                   self.batched_decoding.get(), lambda: self.is_processing, on_wait)
+        self.log(f"   🧮 {plan.reason}")
+        self.event("admission", mode=plan.mode, chunk_minutes=plan.chunk_minutes,
+                   streaming=plan.streaming, duration=duration, reason=plan.reason)
+        
+        self.audio_file = audio_file
+        self.full_audio = None
+        self.mel_frontend = None
+        get_audio_decoder().reset()
+        if plan.load_full_audio:
+            self.load_full_audio(audio_file)
+        if self.full_audio is not None:
+            self.audio_duration = len(self.full_audio) / SAMPLE_RATE
+        else:
+            self.audio_duration = duration or 0.0
+        return plan
+    
+    def retry_audio_available(self):
+        """是否能擷取重轉用的音訊（整檔已解碼，或可逐段解碼）"""
+        return self.full_audio is not None or ((self.ffmpeg_ok or PYAV_AVAILABLE) and self.audio_duration > 0)
+    
+    def transcribe_file(self, audio_file, device):
+        """以目前載入的模型轉錄整個檔案"""
+        plan = self.prepare_audio(audio_file, device)
+        
+        if plan.mode == "batched":
+            return self.transcribe_batched(audio_file, device)
+        elif plan.mode == "chunked" and (self.full_audio is not None or plan.streaming):
+            self.log(f"   ✂️ 檔案較大，分段處理...")
+            return self.transcribe_chunked(audio_file, device, plan.chunk_minutes)
+        else:
+            return self.transcribe_direct(audio_file, device)
+    
+    def refine_draft(self, audio_file, draft, device):
+        """兩階段模式第二階段：以大模型重轉草稿中語意不明的片段，沿用原時間戳就地替換"""
+        self.prepare_audio(audio_file, device)
+        segments = draft["segments"]
+        if not self.retry_audio_available() or len(segments) == 0:
+            self.log("   ⚠️ 無法擷取音訊片段，改為完整轉錄")
+            return self.transcribe_file(audio_file, device)
+        
+        masks = self.score_unclear_segments(segments)
+        flagged = np.flatnonzero(masks)
+        segments.set_column("unclear_mask", flagged, masks[flagged])
+        self.log(f"   ✏️ 草稿中 {len(flagged)}/{len(segments)} 個片段需要精修")
+        
+        options = self.get_transcribe_options(device, attempt=0)
+        encoder_cache = EncoderCache(self.model)
+        refined = 0
+        start_time = time.time()
+        
+        for rank, i in enumerate(flagged.tolist(), 1):
+            if not self.is_processing:
+                break
+            self.status(f"精修片段 {rank}/{len(flagged)}...", "orange")
+            
+            seg = segments[i]
+            attempt_start = time.time()
+            try:
+                new_seg = transcribe_retry_clip(self.model, seg, self.get_retry_clip(seg), options, encoder_cache)
+            except Exception as e:
+                new_seg = None
+                self.log(f"      ❌ 片段 {i+1} 精修失敗：{e}")
+            segments.set_column("retry_attempts", i, 1)
+            segments.set_column("retry_seconds", i, time.time() - attempt_start)
+            if not new_seg or not new_seg["text"]:
+                continue
+            
+            # 與重轉相同的把關：信心度不低於草稿、語意不明原因不增加才採用
+            new_mask = self.score_unclear_segments([new_seg])[0]
+            if (new_seg.get("avg_logprob", -999) >= segments.avg_logprob[i]
+                    and count_unclear_reasons(new_mask) <= count_unclear_reasons(masks[i])):
+                segments.update(i, new_seg)
+                segments.set_column("unclear_mask", i, new_mask)
+                segments.set_column("retry_strategy", i, REFINE_STRATEGY)
+                refined += 1
+        
+        self.log(f"   ✏️ 精修 {refined} 個片段（耗時 {time.time() - start_time:.1f} 秒）")
+        
+        return {
+            "text": segments.full_text(),
+            "segments": segments,
+            "language": draft.get("language", "unknown"),
+        }
+    
     def transcribe_direct(self, audio_file, device):
         """直接轉錄"""
         self.status(f"轉錄中：{os.path.basename(audio_file)}", "orange")
@@ -875,7 +3691,8 @@ class WhisperTranscriberV5:
         start_time = time.time()
         
         try:
-            result = self.model.transcribe(audio_file, **options)
+            audio = self.full_audio if self.full_audio is not None else get_audio_decoder().decode(audio_file)
+            result = self.model.transcribe(audio, **options)
         except Exception as e:
             self.current_bar.stop()
             raise e
@@ -884,8 +3701,14 @@ class WhisperTranscriberV5:
         
         self.current_bar.stop()
         
-        segments = result.get("segments", [])
-        detected_lang = result.get("language", "?")
+        # 只保留需要的欄位，改用欄位式儲存
+        segments = SegmentStore.from_segments(result.get("segments", []))
+        result = {
+            "text": segments.full_text(),
+            "segments": segments,
+            "language": result.get("language", "unknown"),
+        }
+        detected_lang = result["language"]
         
         self.log(f"   耗時：{elapsed:.1f} 秒")
         self.log(f"   偵測語言：{detected_lang}")
@@ -893,30 +3716,114 @@ class WhisperTranscriberV5:
         
         return result
     
-    def transcribe_chunked(self, audio_file, device):
-        """分段轉錄"""
-        chunk_ms = self.chunk_length.get() * 60 * 1000
+    def transcribe_batched(self, audio_file, device):
+        """批次解碼：整檔切成 30 秒視窗，成批編碼與解碼"""
+        self.status(f"批次轉錄中：{os.path.basename(audio_file)}", "orange")
+        
+        options = self.get_transcribe_options(device, attempt=0)
+        if options.get("word_timestamps"):
+            self.log("   ⚠️ 批次解碼不產生逐字時間戳記，本檔僅輸出片段時間")
+        
+        start_time = time.time()
+        audio = self.full_audio if self.full_audio is not None else get_audio_decoder().decode(audio_file)
+        self.mel_frontend = MelFrontend(audio, self.model.dims.n_mels, self.model.device)
+        del audio
+        self.log(f"   🎚️ log-mel：{self.mel_frontend.duration / 60:.1f} 分鐘，"
+                 f"{self.mel_frontend.nbytes / (1024 * 1024):.0f} MB，{time.time() - start_time:.1f} 秒")
+        decoder = BatchedDecoder(self.model, self.decode_batch_size.get())
+        
+        def on_batch(done, total):
+            self.status(f"批次轉錄：{done}/{total} 個視窗", "orange")
+        
+        self.current_bar.start()
+        try:
+            segments, language = decoder.transcribe(self.mel_frontend, options, on_batch)
+        finally:
+            self.current_bar.stop()
+        elapsed = time.time() - start_time
+        
+        self.log(f"   耗時：{elapsed:.1f} 秒（批次大小 {decoder.batch_size}）")
+        self.log(f"   偵測語言：{language}")
+        self.log(f"   片段數：{len(segments)}")
+        
+        return {
+            "text": segments.full_text(),
+            "segments": segments,
+            "language": language,
+        }
+    
+    def transcribe_chunked(self, audio_file, device, chunk_minutes=None):
+        """分段轉錄（未解碼整檔時為串流模式，每段才解碼）"""
+        chunk_ms = (chunk_minutes or self.chunk_length.get()) * 60 * 1000
         audio = self.full_audio
+        total_ms = int(self.audio_duration * 1000)
         
-        duration_min = len(audio) / (1000 * 60)
+        duration_min = total_ms / (1000 * 60)
         self.log(f"   時長：{duration_min:.1f} 分鐘")
         
         # 切割（含重疊）
         overlap_ms = 2000  # 2 秒重疊
         chunks = []
         start = 0
-        while start < len(audio):
-            end = min(start + chunk_ms, len(audio))
-            chunks.append((start, audio[start:end]))
+        while start < total_ms:
+            end = min(start + chunk_ms, total_ms)
+            chunk = AudioRange(audio_file, start, end - start, audio)
+            chunks.append((start, chunk))
+            if end >= total_ms:
+                break
             start = end - overlap_ms
         
         self.log(f"   分為 {len(chunks)} 段")
         
-        if not os.path.exists(self.temp_dir):
-            os.makedirs(self.temp_dir)
-        
-        all_segments = []
         options = self.get_transcribe_options(device, attempt=0)
+        workers = self.cpu_workers.get()
+        writer = self.open_stream_writer(audio_file, len(chunks), overlap_ms / 1000.0)
+        try:
+            if device == "cpu" and workers > 1 and len(chunks) > 1:
+                self.log(f"   ⚡ 使用 {workers} 個程序平行轉錄各段")
+                chunk_results, language = self.transcribe_chunks_parallel(chunks, options, workers, writer)
+            else:
+                chunk_results, language = self.transcribe_chunks_serial(chunks, options, writer)
+        finally:
+            if writer:
+                writer.finish()
+        
+        all_segments, aligned = stitch_chunks(chunk_results)
+        if len(chunk_results) > 1:
+            self.log(f"   🧵 接縫對齊：{aligned}/{len(chunk_results) - 1} 處以文字對齊，其餘依前段結束時間切開")
+        
+        full_text = all_segments.full_text()
+        
+        return {
+            "text": full_text,
+            "segments": all_segments,
+            "language": language
+        }
+    
+    def open_stream_writer(self, audio_file, total_chunks, overlap_seconds):
+        """建立分段串流輸出，未開啟此功能時回傳 None"""
+        if not self.stream_output.get() or not (self.output_txt.get() or self.output_srt.get()):
+            return None
+        
+        base_name = os.path.splitext(os.path.basename(audio_file))[0]
+        base_path = os.path.join(self.output_folder.get(), base_name)
+        
+        def post_process(segments):
+            return self.post_process({"segments": segments}, quiet=True)["segments"]
+        
+        try:
+            writer = StreamingTranscriptWriter(base_path, total_chunks, self.output_txt.get(),
+                                               self.output_srt.get(), post_process,
+                                               overlap_seconds=overlap_seconds)
+        except OSError as e:
+            self.log(f"   ⚠️ 無法建立串流輸出：{e}")
+            return None
+        self.log(f"   📝 串流輸出：{base_name} 的 TXT/SRT 會隨分段完成更新")
+        return writer
+    
+    def transcribe_chunks_serial(self, chunks, options, writer=None):
+        """依序轉錄各段，回傳 (各段結果, 語言)"""
+        chunk_results = []
         result = None
         
         for i, (offset_ms, chunk) in enumerate(chunks, 1):
@@ -926,45 +3833,69 @@ class WhisperTranscriberV5:
             self.status(f"轉錄片段 {i}/{len(chunks)}...", "orange")
             self.current_bar.start()
             
-            temp_file = os.path.join(self.temp_dir, f"chunk_{i}.wav")
-            chunk.export(temp_file, format="wav")
+            audio_input = chunk.to_array()
+            # 轉錄這段時於背景先解碼下一段
+            if i < len(chunks):
+                chunks[i][1].prefetch()
             
-            try:
-                result = self.model.transcribe(temp_file, **options)
-                
-                offset_sec = offset_ms / 1000.0
-                for seg in result.get("segments", []):
-                    # 跳過重疊區的重複內容
-                    if i > 1 and seg["start"] < (overlap_ms / 1000):
-                        continue
-                    
-                    new_seg = {
-                        "start": seg["start"] + offset_sec,
-                        "end": seg["end"] + offset_sec,
-                        "text": seg["text"].strip(),
-                        "avg_logprob": seg.get("avg_logprob", 0),
-                        "no_speech_prob": seg.get("no_speech_prob", 0),
-                        "compression_ratio": seg.get("compression_ratio", 1),
-                    }
-                    all_segments.append(new_seg)
-                
-            finally:
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+            result = self.model.transcribe(audio_input, **options)
+            del audio_input
+            
+            # 保留完整結果，重疊區稍後再對齊拼接
+            offset_sec = offset_ms / 1000.0
+            end_sec = offset_sec + len(chunk) / 1000.0
+            segments = SegmentStore.from_segments(result.get("segments", []), offset_sec)
+            chunk_results.append((offset_sec, end_sec, segments))
+            if writer:
+                writer.add_chunk(i, offset_sec, end_sec, segments)
             
             self.clear_memory()
         
         self.current_bar.stop()
         
-        full_text = " ".join([s["text"] for s in all_segments if s["text"]])
+        language = result.get("language", "unknown") if result else "unknown"
+        return chunk_results, language
+    
+    def transcribe_chunks_parallel(self, chunks, options, workers, writer=None):
+        """以多個工作程序平行轉錄各段（CPU 模式），回傳 (各段結果, 語言)"""
+        pool = self.get_worker_pool(workers)
+        chunk_results = []
+        languages = {}
+        futures = {}
+        pending = list(enumerate(chunks, 1))
+        
+        def submit_next():
+            # 限制在途分段數，避免一次把整個檔案的音訊陣列都送出
+            while pending and len(futures) < workers * 2 and self.is_processing:
+                i, (offset_ms, chunk) = pending.pop(0)
+                offset_sec = offset_ms / 1000.0
+                end_sec = offset_sec + len(chunk) / 1000.0
+                future = pool.submit(_chunk_worker_run, i, offset_sec, end_sec,
+                                     chunk.to_array(), options)
+                futures[future] = i
+            if pending:
+                pending[0][1][1].prefetch()
         
-        return {
-            "text": full_text,
-            "segments": all_segments,
-            "language": result.get("language", "unknown") if result else "unknown"
-        }
+        self.current_bar.start()
+        submit_next()
+        
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.pop(future)
+                i, offset_sec, end_sec, segments, language = future.result()
+                chunk_results.append((offset_sec, end_sec, segments))
+                if writer:
+                    writer.add_chunk(i, offset_sec, end_sec, segments)
+                languages[language] = languages.get(language, 0) + 1
+                self.status(f"轉錄片段 {len(chunk_results)}/{len(chunks)}...", "orange")
+            submit_next()
+        
+        self.current_bar.stop()
+        
+        # 各段偵測語言不同時，取最多段的語言
+        language = max(languages, key=languages.get) if languages else "unknown"
+        return chunk_results, language
     
     def retry_unclear_segments(self, result, device):
         """重新轉錄語意不明的片段"""
@@ -972,110 +3903,272 @@ class WhisperTranscriberV5:
         if not segments:
             return result, 0
         
-        retry_count = 0
         max_attempts = self.max_retry_attempts.get()
-        improved_segments = []
         
-        for i, seg in enumerate(segments):
-            reasons = self.is_unclear_segment(seg)
-            
-            if reasons:
-                self.log(f"      ⚠️ 片段 {i+1} 語意不明：{', '.join(reasons)}")
-                self.log(f"         原文：{seg['text'][:50]}...")
-                
-                # 嘗試重新轉錄
-                best_seg = seg
-                best_score = seg.get("avg_logprob", -999)
-                
-                for attempt in range(max_attempts):
-                    new_seg = self.retry_single_segment(seg, device, attempt)
-                    
-                    if new_seg:
-                        new_score = new_seg.get("avg_logprob", -999)
-                        new_reasons = self.is_unclear_segment(new_seg)
-                        
-                        # 如果新結果更好
-                        if new_score > best_score and len(new_reasons) < len(reasons):
-                            best_seg = new_seg
-                            best_score = new_score
-                            self.log(f"         ✅ 重轉 {attempt+1}：{new_seg['text'][:50]}...")
-                
-                if best_seg != seg:
-                    retry_count += 1
-                
-                improved_segments.append(best_seg)
-            else:
-                improved_segments.append(seg)
+        # 一次評分整份清單，只處理有問題的片段
+        masks = self.score_unclear_segments(segments)
+        flagged = np.flatnonzero(masks)
+        if len(flagged) == 0:
+            return result, 0
+        segments.set_column("unclear_mask", flagged, masks[flagged])
+        
+        # 依嚴重程度排序，並依音檔時長設定重轉預算
+        scheduler = RetryScheduler(self.audio_duration, self.retry_budget_ratio.get(),
+                                   history=self.strategy_history)
+        self.retry_scheduler = scheduler
+        order = scheduler.rank(segments, masks, flagged)
+        
+        self.log(f"   🔍 偵測到 {len(flagged)} 個語意不明片段（重轉預算：{scheduler.format_budget()}）")
+        
+        # 逐字稿只有拉丁字母時，不必強制指定中文／日文
+        skipped = scheduler.skip_unused_languages(
+            SCRIPT_CLASSIFIER.classify(result.get("text", "")))
+        if skipped:
+            names = "、".join(RETRY_STRATEGY_NAMES[s] for s in skipped)
+            self.log(f"   ⏭️ 逐字稿中沒有對應文字，略過策略：{names}")
+        
+        # 小模型初篩：只有小模型也判為不清楚或與原文不一致的片段才交給大模型
+        screening = None
+        if self.draft_model is not None:
+            screening = DraftScreening()
+            order = self.screen_with_draft(segments, masks, order, scheduler, screening,
+                                           device, result.get("language"))
+        retry_start = scheduler.elapsed
+        
+        workers = self.cpu_workers.get()
+        if device == "cpu" and workers > 1 and len(order) > 1:
+            self.log(f"   ⚡ 使用 {workers} 個程序平行重轉")
+            improved = self.retry_segments_parallel(segments, masks, order, scheduler,
+                                                    device, max_attempts, workers)
+        else:
+            # 同一片段的各策略共用編碼結果，只重跑解碼器
+            encoder_cache = EncoderCache(self.model, self.mel_frontend)
+            improved = self.retry_segments_serial(segments, masks, order, scheduler,
+                                                  device, max_attempts, encoder_cache)
+            self.log(f"   🧠 編碼快取：{encoder_cache.report()}")
+            encoder_cache.clear()
+        
+        # 依原位置寫回改善後的片段
+        for i, best_seg in improved.items():
+            segments.update(i, best_seg)
+        retry_count = len(improved)
+        
+        self.log(f"   ⏱️ {scheduler.report()}")
+        self.event("retry_summary", flagged=len(flagged), improved=retry_count, elapsed=scheduler.elapsed,
+                   skipped=scheduler.skipped, trials=scheduler.trials, successes=scheduler.successes)
+        if screening:
+            screening.escalated_time = scheduler.elapsed - retry_start
+            self.log(f"   🐣 {screening.report()}")
+        
+        # 保存策略成功率，供同一輸出資料夾的後續檔案參考
+        if self.strategy_history:
+            self.strategy_history.merge(scheduler)
+            self.strategy_history.save()
         
         if retry_count > 0:
             self.log(f"   🔄 共改善 {retry_count} 個片段")
         
-        full_text = " ".join([s["text"] for s in improved_segments if s.get("text")])
-        
         return {
-            "text": full_text,
-            "segments": improved_segments,
+            "text": segments.full_text(),
+            "segments": segments,
             "language": result.get("language", "unknown")
         }, retry_count
     
-    def retry_single_segment(self, segment, device, attempt):
-        """重新轉錄單個片段"""
-        if not self.full_audio:
-            return None
-        
-        start_ms = int(segment["start"] * 1000)
-        end_ms = int(segment["end"] * 1000)
+    def get_retry_strategy_options(self, device, strategy):
+        """取得重轉策略對應的轉錄參數"""
+        if strategy == "temperature":
+            return self.get_transcribe_options(device, attempt=1)
+        elif strategy in ("zh", "ja", "en"):
+            return self.get_retry_options_for_language(device, strategy)
+        else:
+            return self.get_transcribe_options(device, attempt=3)
+    
+    def screen_with_draft(self, segments, masks, order, scheduler, screening, device, language):
+        """以小模型初篩語意不明片段，回傳需要升級到大模型的片段順序"""
+        threshold = self.confidence_threshold.get()
+        options = self.get_transcribe_options(device, attempt=0)
+        options["word_timestamps"] = False
+        if language and language != "unknown":
+            options["language"] = language
+        
+        # 小模型的梅爾頻帶數與大模型相同時才能沿用整檔 log-mel
+        frontend = self.mel_frontend
+        if frontend is not None and frontend.n_mels != self.draft_model.dims.n_mels:
+            frontend = None
+        encoder_cache = EncoderCache(self.draft_model, frontend)
+        
+        escalated = []
+        for rank, i in enumerate(order):
+            if not self.is_processing or not scheduler.has_budget():
+                escalated.extend(order[rank:])
+                break
+            
+            seg = segments[i]
+            self.prefetch_retry_clip(segments, order, rank)
+            verdict, elapsed = draft_screen_segment(self.draft_model, seg, masks[i], self.get_retry_clip(seg),
+                                                    options, threshold, encoder_cache=encoder_cache)
+            scheduler.charge(elapsed)
+            screening.record(verdict, elapsed)
+            if verdict == DRAFT_ESCALATE:
+                escalated.append(i)
+            else:
+                self.log(f"      🐣 片段 {i+1}：{DRAFT_VERDICT_NAMES[verdict]}，不交給大模型")
         
-        # 擴展一點範圍
-        start_ms = max(0, start_ms - 500)
-        end_ms = min(len(self.full_audio), end_ms + 500)
+        return np.array(escalated, dtype=order.dtype)
+    
+    def retry_segments_serial(self, segments, masks, order, scheduler, device, max_attempts,
+                              encoder_cache=None):
+        """依序重轉語意不明片段，回傳 {索引: 改善後片段}"""
+        threshold = self.confidence_threshold.get()
+        improved = {}
         
-        # 擷取片段
-        segment_audio = self.full_audio[start_ms:end_ms]
+        def should_try(strategy):
+            return scheduler.has_budget() and scheduler.strategy_enabled(strategy)
         
-        if not os.path.exists(self.temp_dir):
-            os.makedirs(self.temp_dir)
+        for rank, i in enumerate(order):
+            if not self.is_processing:
+                break
+            
+            if not scheduler.has_budget():
+                scheduler.skipped = len(order) - rank
+                self.log(f"   ⏱️ 重轉預算已用盡，略過其餘 {scheduler.skipped} 個片段")
+                break
+            
+            seg = segments[i]
+            self.log_unclear_segment(i, seg, masks[i])
+            self.prefetch_retry_clip(segments, order, rank)
+            
+            def on_attempt(strategy, elapsed, was_improved, new_seg, error):
+                self.handle_retry_attempt(scheduler, strategy, was_improved, new_seg, error, elapsed)
+            
+            # 每個片段都依目前的成功率重新排序策略
+            attempts = [(strategy, self.get_retry_strategy_options(device, strategy))
+                        for strategy in scheduler.ordered_strategies(max_attempts)]
+            best_seg, history = run_retry_attempts(self.model, seg, masks[i], self.get_retry_clip(seg),
+                                                   attempts, threshold, should_try, on_attempt,
+                                                   encoder_cache)
+            record_retry_history(segments, i, history)
+            
+            if best_seg is not seg:
+                improved[i] = best_seg
         
-        temp_file = os.path.join(self.temp_dir, f"retry_{start_ms}.wav")
-        segment_audio.export(temp_file, format="wav")
+        return improved
+    
+    def retry_segments_parallel(self, segments, masks, order, scheduler, device, max_attempts, workers):
+        """以多個工作程序平行重轉語意不明片段（CPU 模式），回傳 {索引: 改善後片段}"""
+        threshold = self.confidence_threshold.get()
+        pool = self.get_worker_pool(workers)
+        improved = {}
+        futures = {}
+        pending = list(order)
+        # 已計入的時間（例如小模型初篩）保留，平行重轉只加上之後的實際經過時間
+        base_elapsed = scheduler.elapsed
+        start_time = time.time()
         
-        try:
-            # 根據嘗試次數選擇不同策略
-            if attempt == 0:
-                options = self.get_transcribe_options(device, attempt=1)
-            elif attempt == 1:
-                options = self.get_retry_options_for_language(device, "zh")
-            elif attempt == 2:
-                options = self.get_retry_options_for_language(device, "ja")
-            else:
-                options = self.get_transcribe_options(device, attempt=3)
+        def submit_next():
+            # 只保持少量片段在途中，讓預算與策略成功率能套用到後續片段
+            while pending and len(futures) < workers * 2 and scheduler.has_budget() and self.is_processing:
+                i = pending.pop(0)
+                seg = segments[i]
+                self.log_unclear_segment(i, seg, masks[i])
+                attempts = [(strategy, self.get_retry_strategy_options(device, strategy))
+                            for strategy in scheduler.ordered_strategies(max_attempts)]
+                future = pool.submit(_retry_worker_run, i, seg, masks[i],
+                                     self.get_retry_clip(seg), attempts, threshold)
+                futures[future] = i
+            if pending and scheduler.has_budget():
+                self.retry_clip_range(segments[pending[0]]).prefetch()
+        
+        submit_next()
+        
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
             
-            result = self.model.transcribe(temp_file, **options)
-            
-            if result.get("segments"):
-                seg = result["segments"][0]
-                return {
-                    "start": segment["start"],
-                    "end": segment["end"],
-                    "text": seg["text"].strip(),
-                    "avg_logprob": seg.get("avg_logprob", 0),
-                    "no_speech_prob": seg.get("no_speech_prob", 0),
-                    "compression_ratio": seg.get("compression_ratio", 1),
-                }
+            for future in done:
+                futures.pop(future)
+                try:
+                    i, best_seg, history = future.result()
+                except Exception as e:
+                    self.log(f"         ❌ 重轉失敗：{e}")
+                    continue
+                
+                # 預算以實際經過時間另計，這裡只記錄工作程序量到的耗時
+                for strategy, elapsed, was_improved, new_seg, error in history:
+                    self.handle_retry_attempt(scheduler, strategy, was_improved, new_seg, error,
+                                              elapsed, charge=False)
+                record_retry_history(segments, i, history)
+                if any(record[2] for record in history):
+                    improved[i] = best_seg
             
-        except Exception as e:
-            self.log(f"         ❌ 重轉失敗：{e}")
+            # 平行模式以實際經過時間計算預算
+            scheduler.charge(time.time() - start_time - (scheduler.elapsed - base_elapsed))
+            submit_next()
         
-        finally:
-            try:
-                os.remove(temp_file)
-            except:
-                pass
+        if pending:
+            scheduler.skipped = len(pending)
+            self.log(f"   ⏱️ 重轉預算已用盡，略過其餘 {scheduler.skipped} 個片段")
         
-        return None
+        return improved
+    
+    def get_worker_pool(self, workers):
+        """取得 CPU 工作程序池（整批處理共用，避免重複載入模型）"""
+        if self.worker_pool is None or self.worker_pool_size != workers or self.worker_pool_model != self.model_name:
+            self.shutdown_worker_pool()
+            num_threads = max(1, (os.cpu_count() or 1) // workers)
+            self.worker_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(self.model_name, num_threads),
+            )
+            self.worker_pool_size = workers
+            self.worker_pool_model = self.model_name
+        return self.worker_pool
+    
+    def shutdown_worker_pool(self):
+        """關閉 CPU 工作程序池"""
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown(wait=False)
+            self.worker_pool = None
+            self.worker_pool_size = 0
+            self.worker_pool_model = None
+    
+    def log_unclear_segment(self, index, segment, mask):
+        """記錄語意不明片段"""
+        reasons = describe_unclear_reasons(mask, segment)
+        self.log(f"      ⚠️ 片段 {index+1} 語意不明：{', '.join(reasons)}")
+        self.log(f"         原文：{segment['text'][:50]}...")
+        self.event("unclear_segment", index=int(index), start=segment["start"], end=segment["end"],
+                   mask=int(mask), reasons=reasons, avg_logprob=segment.get("avg_logprob"))
+    
+    def handle_retry_attempt(self, scheduler, strategy, improved, new_seg, error, elapsed=0.0, charge=True):
+        """記錄單次重轉結果並更新排程統計（charge 為 False 時耗時只寫入日誌，不計入預算）"""
+        if error:
+            self.log(f"         ❌ 重轉失敗：{error}")
+        if improved:
+            self.log(f"         ✅ 重轉（{RETRY_STRATEGY_NAMES[strategy]}）：{new_seg['text'][:50]}...")
+        self.event("retry_attempt", strategy=strategy, improved=improved, elapsed=elapsed, error=error)
+        if scheduler.record(strategy, improved, elapsed if charge else 0.0):
+            self.log(f"      ⚠️ 策略「{RETRY_STRATEGY_NAMES[strategy]}」成功率過低，本檔案不再使用")
+    
+    def retry_clip_range(self, segment):
+        """重轉用的音訊範圍（前後各延伸 RETRY_CLIP_PADDING 秒）"""
+        padding_ms = int(RETRY_CLIP_PADDING * 1000)
+        start_ms = max(0, int(segment["start"] * 1000) - padding_ms)
+        end_ms = min(int(self.audio_duration * 1000), int(segment["end"] * 1000) + padding_ms)
+        return AudioRange(self.audio_file, start_ms, max(0, end_ms - start_ms), self.full_audio)
+    
+    def get_retry_clip(self, segment):
+        """擷取重轉用的音訊（串流模式時只解碼這一段）"""
+        return self.retry_clip_range(segment).to_array()
     
-    def post_process(self, result):
-        """後處理"""
+    def prefetch_retry_clip(self, segments, order, rank):
+        """於背景先解碼順序中下一個片段的音訊"""
+        if rank + 1 < len(order):
+            self.retry_clip_range(segments[order[rank + 1]]).prefetch()
+    
+    def post_process(self, result, quiet=False):
+        """後處理（quiet 為 True 時不寫日誌，供串流輸出的滑動視窗使用）"""
         segments = result.get("segments", [])
         if not segments:
             return result
@@ -1086,21 +4179,25 @@ class WhisperTranscriberV5:
         if self.remove_duplicates.get():
             segments = self.remove_duplicate_segments(segments)
             removed = original_count - len(segments)
-            if removed > 0:
+            if removed > 0 and not quiet:
                 self.log(f"   🧹 移除 {removed} 個重複")
+            
+            segments = self.remove_repetition_loops(segments, quiet)
+        
+        # 移除近似重複（分段接縫、略有差異的幻覺循環）
+        if self.remove_near_duplicates.get():
+            segments = self.remove_near_duplicate_segments(segments, quiet=quiet)
         
         # 合併短片段
         if self.merge_short_segments.get():
             before = len(segments)
             segments = self.merge_short(segments)
             merged = before - len(segments)
-            if merged > 0:
+            if merged > 0 and not quiet:
                 self.log(f"   📎 合併 {merged} 個短片段")
         
-        full_text = " ".join([s["text"] for s in segments if s.get("text")])
-        
         return {
-            "text": full_text,
+            "text": segments.full_text(),
             "segments": segments,
             "language": result.get("language", "unknown")
         }
@@ -1110,14 +4207,12 @@ class WhisperTranscriberV5:
         if not segments:
             return segments
         
-        cleaned = []
-        prev_text = ""
+        keep = np.zeros(len(segments), dtype=bool)
+        prev_normalized = ""
         repeat_count = 0
         
-        for seg in segments:
-            text = seg.get("text", "").strip()
-            normalized = re.sub(r'[^\w]', '', text.lower())
-            prev_normalized = re.sub(r'[^\w]', '', prev_text.lower())
+        for i, text in enumerate(segments.texts()):
+            normalized = NON_WORD_RE.sub('', text.lower())
             
             if normalized == prev_normalized and normalized:
                 repeat_count += 1
@@ -1129,10 +4224,97 @@ class WhisperTranscriberV5:
             if len(normalized) < 2:
                 continue
             
-            cleaned.append(seg)
-            prev_text = text
+            keep[i] = True
+            prev_normalized = normalized
+        
+        return segments.select(keep)
+    
+    def remove_repetition_loops(self, segments, quiet=False):
+        """移除跨片段的循環重複內容（幻覺循環）"""
+        if not segments:
+            return segments
+        
+        texts = segments.texts()
+        token_ids, owners, char_starts, char_ends = tokenize_segments(texts)
+        remove = find_repetition_loops(token_ids)
+        if not remove.any():
+            return segments
+        
+        # 每個片段的詞數與被移除的詞數
+        total_tokens = np.bincount(owners, minlength=len(texts))
+        removed_tokens = np.bincount(owners[remove], minlength=len(texts))
+        keep = ~((total_tokens > 0) & (removed_tokens == total_tokens))
+        
+        # 部分被移除的片段：刪去每段連續被移除的詞，直到下一個保留的詞為止
+        for index in np.flatnonzero(keep & (removed_tokens > 0)).tolist():
+            first = np.searchsorted(owners, index, side='left')
+            last = np.searchsorted(owners, index, side='right')
+            spans = []
+            cursor = 0
+            previous_removed = False
+            for t in range(first, last):
+                if remove[t] and not previous_removed:
+                    spans.append((cursor, char_starts[t]))
+                    cursor = None
+                elif not remove[t] and previous_removed:
+                    cursor = char_starts[t]
+                previous_removed = remove[t]
+            if cursor is not None:
+                spans.append((cursor, len(texts[index])))
+            # 文字、字詞與起訖時間一併裁切
+            segments.keep_text_spans(index, spans)
+        
+        dropped = int((~keep).sum())
+        if not quiet:
+            self.log(f"   🔁 移除循環重複 {int(remove.sum())} 個字詞（刪除 {dropped} 個片段）")
+        
+        return segments.select(keep)
+    
+    def remove_near_duplicate_segments(self, segments, window=5, min_length=6, quiet=False):
+        """以 MinHash 比對相鄰片段，合併或刪除近似重複的片段"""
+        if len(segments) < 2:
+            return segments
+        
+        threshold = self.near_duplicate_threshold.get()
+        normalized = [NON_WORD_RE.sub('', t.lower()) for t in segments.texts()]
+        
+        hasher = MinHasher()
+        signatures, valid = hasher.signatures(normalized)
+        # 太短的片段（如「好的」「對」）常是正常重複，不列入比對
+        valid &= np.fromiter(map(len, normalized), dtype=np.int64, count=len(normalized)) >= min_length
         
-        return cleaned
+        similarity = hasher.neighbour_similarity(signatures, window)
+        rows, cols = np.nonzero(similarity >= threshold)
+        if len(rows) == 0:
+            return segments
+        
+        keep = np.ones(len(segments), dtype=bool)
+        starts = segments.start.tolist()
+        ends = segments.end.tolist()
+        logprobs = segments.avg_logprob.tolist()
+        merged = 0
+        
+        for i, d in zip(rows.tolist(), cols.tolist()):
+            j = i + d + 1
+            if not (valid[i] and valid[j] and keep[i] and keep[j]):
+                continue
+            
+            # 保留信心度較高的一方
+            winner, loser = (i, j) if logprobs[i] >= logprobs[j] else (j, i)
+            keep[loser] = False
+            
+            # 時間上重疊或緊鄰（分段接縫）時，將保留的片段延伸涵蓋兩者
+            if starts[j] - ends[i] < 1.0:
+                starts[winner] = min(starts[i], starts[j])
+                ends[winner] = max(ends[i], ends[j])
+                segments.set_times(winner, starts[winner], ends[winner])
+                merged += 1
+        
+        removed = int((~keep).sum())
+        if removed > 0 and not quiet:
+            self.log(f"   🧩 移除 {removed} 個近似重複片段（其中 {merged} 個為接縫合併）")
+        
+        return segments.select(keep)
     
     def merge_short(self, segments):
         """合併短片段"""
@@ -1140,30 +4322,32 @@ class WhisperTranscriberV5:
             return segments
         
         min_len = self.min_segment_length.get()
-        merged = []
+        starts = segments.start.tolist()
+        ends = segments.end.tolist()
+        group_ids = np.zeros(len(segments), dtype=np.int64)
         
+        group = 0
         i = 0
-        while i < len(segments):
-            seg = segments[i].copy()
-            duration = seg["end"] - seg["start"]
+        while i < len(starts):
+            group_start = starts[i]
+            group_end = ends[i]
+            group_ids[i] = group
             
-            while duration < min_len and i + 1 < len(segments):
-                next_seg = segments[i + 1]
-                gap = next_seg["start"] - seg["end"]
+            while group_end - group_start < min_len and i + 1 < len(starts):
+                gap = starts[i + 1] - group_end
                 if gap > 2:
                     break
                 
-                seg["end"] = next_seg["end"]
-                seg["text"] = seg["text"] + " " + next_seg.get("text", "")
-                duration = seg["end"] - seg["start"]
                 i += 1
+                group_ids[i] = group
+                group_end = ends[i]
             
-            merged.append(seg)
+            group += 1
             i += 1
         
-        return merged
+        return segments.merge_groups(group_ids)
     
-    def save_results(self, audio_file, result):
+    def save_results(self, audio_file, result, timings=None):
         """儲存轉錄結果"""
         base_name = os.path.splitext(os.path.basename(audio_file))[0]
         output_dir = self.output_folder.get()
@@ -1185,15 +4369,16 @@ class WhisperTranscriberV5:
         if self.output_srt.get():
             srt_path = os.path.join(output_dir, f"{base_name}.srt")
             with open(srt_path, "w", encoding="utf-8") as f:
-                for i, seg in enumerate(segments, 1):
-                    start_time = self.format_srt_time(seg["start"])
-                    end_time = self.format_srt_time(seg["end"])
-                    text = seg.get("text", "").strip()
-                    
-                    f.write(f"{i}\n")
-                    f.write(f"{start_time} --> {end_time}\n")
-                    f.write(f"{text}\n\n")
+                self.write_srt(f, segments.start.tolist(), segments.end.tolist(), segments.texts())
             saved_files.append("SRT")
+            
+            # 逐字時間戳記
+            words = segments.row_word_store() if self.word_timestamps.get() else None
+            if words is not None and len(words) > 0:
+                words_path = os.path.join(output_dir, f"{base_name}.words.srt")
+                with open(words_path, "w", encoding="utf-8") as f:
+                    self.write_srt(f, words.start.tolist(), words.end.tolist(), words.texts())
+                saved_files.append("逐字 SRT")
         
         # MD 格式
         if self.output_md.get():
@@ -1207,30 +4392,83 @@ class WhisperTranscriberV5:
                 f.write(f"**智慧重轉**：{'開啟' if self.auto_retry_unclear.get() else '關閉'}\n")
                 
                 if segments:
-                    total_duration = segments[-1]["end"]
+                    total_duration = segments.end[-1]
                     duration_str = str(timedelta(seconds=int(total_duration)))
                     f.write(f"**總時長**：{duration_str}\n")
                 
+                script_counts = SCRIPT_CLASSIFIER.classify(full_text)
+                f.write(f"**文字組成**：{SCRIPT_CLASSIFIER.format_counts(script_counts)}\n")
+                
                 f.write(f"\n---\n\n")
                 
-                for seg in segments:
-                    start = str(timedelta(seconds=int(seg["start"])))
-                    end = str(timedelta(seconds=int(seg["end"])))
-                    text = seg.get("text", "").strip()
+                for seg_start, seg_end, text in zip(segments.start.tolist(), segments.end.tolist(), segments.texts()):
+                    start = str(timedelta(seconds=int(seg_start)))
+                    end = str(timedelta(seconds=int(seg_end)))
+                    text = text.strip()
                     
                     f.write(f"**[{start} → {end}]**\n\n")
                     f.write(f"{text}\n\n")
             saved_files.append("MD")
         
+        # 機器可讀格式（含片段指標與重轉紀錄）
+        if self.output_json.get() or self.output_jsonl.get() or self.output_parquet.get():
+            header = self.export_header(audio_file, result, timings)
+            include_words = self.word_timestamps.get()
+            if self.output_json.get():
+                write_json_transcript(os.path.join(output_dir, f"{base_name}.json"),
+                                      header, segments, include_words)
+                saved_files.append("JSON")
+            if self.output_jsonl.get():
+                write_jsonl_transcript(os.path.join(output_dir, f"{base_name}.jsonl"),
+                                       header, segments, include_words)
+                saved_files.append("JSONL")
+            if self.output_parquet.get() and PYARROW_AVAILABLE:
+                write_parquet_transcript(os.path.join(output_dir, f"{base_name}.parquet"), header, segments)
+                saved_files.append("Parquet")
+        
+        # 完整結果已覆寫串流輸出，移除未完成標記；使用者中途停止時結果不完整，保留標記
+        marker_path = os.path.join(output_dir, f"{base_name}.partial")
+        if self.is_processing and os.path.exists(marker_path):
+            os.remove(marker_path)
+        
         self.log(f"   💾 已儲存：{', '.join(saved_files)}")
     
+    def export_header(self, audio_file, result, timings=None):
+        """機器可讀輸出的檔案資訊"""
+        segments = result.get("segments", [])
+        retried = segments.retry_attempts > 0
+        return {
+            "file": os.path.basename(audio_file),
+            "language": result.get("language", "unknown"),
+            "model": self.model_name or self.model_size.get(),
+            "mode": self.transcribe_mode.get(),
+            "duration": round(self.audio_duration, 3),
+            "segment_count": len(segments),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "settings": {
+                "confidence_threshold": self.confidence_threshold.get(),
+                "auto_retry": self.auto_retry_unclear.get(),
+                "max_retry_attempts": self.max_retry_attempts.get(),
+            },
+            "timings": {stage: round(seconds, 3) for stage, seconds in (timings or {}).items()},
+            "retry": {
+                "flagged": int(np.count_nonzero(segments.unclear_mask)),
+                "retried": int(np.count_nonzero(retried)),
+                "improved": int(np.count_nonzero(segments.retry_strategy >= 0)),
+                "seconds": round(float(segments.retry_seconds.sum()), 3),
+            },
+        }
+    
+    def write_srt(self, f, starts, ends, texts):
+        """寫入 SRT 字幕內容"""
+        for i, (start, end, text) in enumerate(zip(starts, ends, texts), 1):
+            f.write(f"{i}\n")
+            f.write(f"{self.format_srt_time(start)} --> {self.format_srt_time(end)}\n")
+            f.write(f"{text.strip()}\n\n")
+    
     def format_srt_time(self, seconds):
         """格式化 SRT 時間"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds - int(seconds)) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+        return format_srt_time(seconds)
     
     def stop_transcription(self):
         """停止轉錄"""
@@ -1247,6 +4485,11 @@ class WhisperTranscriberV5:
 # 主程式進入點
 # ==========================================
 if __name__ == "__main__":
+    # 平行處理的工作程序需要（Windows 打包執行檔）
+    multiprocessing.freeze_support()
+    if "--startup-benchmark" in sys.argv:
+        run_startup_benchmark()
+        sys.exit(0)
     root = Tk()
     app = WhisperTranscriberV5(root)
     root.mainloop()
\ No newline at end of file
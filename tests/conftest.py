@@ -0,0 +1,14 @@
+import importlib.util
+import os
+
+import pytest
+
+MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audiototexts_v5.10.py")
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    spec = importlib.util.spec_from_file_location("audiototexts_v5_10", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
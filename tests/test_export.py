@@ -0,0 +1,55 @@
+import json
+
+
+def sample_store(app_module):
+    store = app_module.SegmentStore.from_segments([
+        {"start": 0.0, "end": 1.5, "text": "第一句", "avg_logprob": -0.3,
+         "words": [{"word": "第一句", "start": 0.0, "end": 1.5, "probability": 0.9}]},
+        {"start": 1.5, "end": 3.25, "text": "second line", "avg_logprob": -1.2,
+         "words": [{"word": " second", "start": 1.5, "end": 2.0, "probability": 0.5},
+                   {"word": " line", "start": 2.1, "end": 3.25, "probability": 0.6}]},
+    ])
+    store.set_column("unclear_mask", 1, app_module.UNCLEAR_LOW_CONFIDENCE | app_module.UNCLEAR_TOO_SHORT)
+    store.set_column("retry_attempts", 1, 2)
+    store.set_column("retry_seconds", 1, 1.25)
+    store.set_column("retry_strategy", 1, app_module.RETRY_STRATEGIES.index("ja"))
+    return store
+
+
+HEADER = {"file": "talk.mp3", "language": "zh", "segment_count": 2}
+
+
+def check_records(records):
+    assert [r["index"] for r in records] == [0, 1]
+    assert records[0]["text"] == "第一句"
+    assert records[0]["unclear"] == [] and records[0]["retry"]["strategy"] is None
+    assert records[1]["end"] == 3.25
+    assert records[1]["unclear"] == ["low_confidence", "too_short"]
+    assert records[1]["retry"] == {"attempts": 2, "seconds": 1.25, "strategy": "ja"}
+
+
+def test_json_transcript(app_module, tmp_path):
+    path = tmp_path / "talk.json"
+    app_module.write_json_transcript(str(path), HEADER, sample_store(app_module), include_words=True)
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    assert {key: document[key] for key in HEADER} == HEADER
+    check_records(document["segments"])
+    assert [w["word"] for w in document["segments"][1]["words"]] == [" second", " line"]
+
+
+def test_jsonl_transcript(app_module, tmp_path):
+    path = tmp_path / "talk.jsonl"
+    app_module.write_jsonl_transcript(str(path), HEADER, sample_store(app_module))
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0] == dict(type="file", **HEADER)
+    assert all(line["type"] == "segment" and "words" not in line for line in lines[1:])
+    check_records(lines[1:])
+
+
+def test_empty_transcript(app_module, tmp_path):
+    path = tmp_path / "empty.json"
+    app_module.write_json_transcript(str(path), HEADER, app_module.SegmentStore())
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["segments"] == []
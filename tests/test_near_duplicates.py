@@ -0,0 +1,42 @@
+import types
+
+
+def fake_app(threshold=0.8):
+    return types.SimpleNamespace(near_duplicate_threshold=types.SimpleNamespace(get=lambda: threshold),
+                                 log=lambda message: None)
+
+
+def test_identical_texts_have_identical_signatures(app_module):
+    hasher = app_module.MinHasher()
+    signatures, valid = hasher.signatures(["abcdefgh", "abcdefgh", "zyxwvuts", ""])
+    assert valid.tolist() == [True, True, True, False]
+    similarity = hasher.neighbour_similarity(signatures, 2)
+    assert similarity[0, 0] == 1.0
+    assert similarity[0, 1] < 0.2
+
+
+def test_minhash_estimates_jaccard(app_module):
+    hasher = app_module.MinHasher(num_perm=256)
+    a = "thequickbrownfoxjumpsoverthelazydog"
+    b = "thequickbrownfoxjumpsoverthelazycat"
+    assert 0.7 < app_module.text_similarity(a, b, hasher) < 1.0
+
+
+def test_seam_duplicate_is_merged_into_better_segment(app_module):
+    store = app_module.SegmentStore.from_segments([
+        {"start": 0.0, "end": 5.0, "text": "We decided to cut the budget in half.", "avg_logprob": -0.5},
+        {"start": 5.2, "end": 9.0, "text": "we decided to cut the budget in half", "avg_logprob": -0.2},
+        {"start": 9.0, "end": 12.0, "text": "Then everyone went home.", "avg_logprob": -0.3},
+    ])
+    result = app_module.WhisperTranscriberV5.remove_near_duplicate_segments(fake_app(), store)
+    assert result.texts() == ["we decided to cut the budget in half", "Then everyone went home."]
+    assert (result.start[0], result.end[0]) == (0.0, 9.0)
+
+
+def test_short_repeated_replies_are_kept(app_module):
+    store = app_module.SegmentStore.from_segments([
+        {"start": 0.0, "end": 1.0, "text": "好的"},
+        {"start": 1.0, "end": 2.0, "text": "好的"},
+    ])
+    result = app_module.WhisperTranscriberV5.remove_near_duplicate_segments(fake_app(), store)
+    assert len(result) == 2
@@ -0,0 +1,25 @@
+def token_ids(app_module, text):
+    return app_module.tokenize_segments([text])[0]
+
+
+def test_loop_keeps_first_copy(app_module):
+    ids = token_ids(app_module, "intro " + "we will see you next time " * 4 + "bye")
+    remove = app_module.find_repetition_loops(ids)
+    assert remove.sum() == 18
+    assert not remove[:7].any() and remove[7:25].all() and not remove[-1]
+
+
+def test_short_repeats_are_kept(app_module):
+    ids = token_ids(app_module, "ha ha ha that is funny")
+    assert not app_module.find_repetition_loops(ids).any()
+
+
+def test_cjk_loop_is_found_per_character(app_module):
+    ids = token_ids(app_module, "謝謝大家收看" * 4)
+    remove = app_module.find_repetition_loops(ids)
+    assert not remove[:6].any() and remove[6:].all()
+
+
+def test_text_without_loops(app_module):
+    ids = token_ids(app_module, "the quick brown fox jumps over the lazy dog")
+    assert not app_module.find_repetition_loops(ids).any()
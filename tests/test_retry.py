@@ -0,0 +1,85 @@
+import types
+
+import pytest
+
+
+def fake_model(segments):
+    return types.SimpleNamespace(transcribe=lambda audio, **options: {"segments": segments})
+
+
+def test_retry_clip_joins_all_segments_inside_clip(app_module):
+    model = fake_model([
+        {"start": 0.0, "end": 2.0, "text": " first part", "avg_logprob": -0.2},
+        {"start": 2.0, "end": 4.0, "text": " and the rest", "avg_logprob": -0.4},
+        {"start": 9.0, "end": 10.0, "text": " beyond the clip", "avg_logprob": -0.1},
+    ])
+    segment = {"start": 10.5, "end": 14.0, "text": "???"}
+    new_seg = app_module.transcribe_retry_clip(model, segment, None, {})
+    assert new_seg["text"] == "first part and the rest"
+    assert (new_seg["start"], new_seg["end"]) == (10.5, 14.0)
+    assert -0.4 < new_seg["avg_logprob"] < -0.2
+
+
+def test_retry_clip_without_text_returns_none(app_module):
+    model = fake_model([{"start": 0.0, "end": 1.0, "text": "  "}])
+    assert app_module.transcribe_retry_clip(model, {"start": 0.0, "end": 1.0}, None, {}) is None
+
+
+def test_retry_history_adds_to_refine_attempt(app_module):
+    store = app_module.SegmentStore.from_segments([{"start": 0.0, "end": 1.0, "text": "a"}])
+    store.set_column("retry_attempts", 0, 1)
+    store.set_column("retry_seconds", 0, 2.0)
+    store.set_column("retry_strategy", 0, app_module.REFINE_STRATEGY)
+    history = [("temperature", 1.5, False, None, None), ("zh", 0.5, False, None, None)]
+    app_module.record_retry_history(store, 0, history)
+    assert store.retry_attempts[0] == 3
+    assert store.retry_seconds[0] == 4.0
+    assert store.retry_strategy[0] == app_module.REFINE_STRATEGY
+
+
+@pytest.mark.parametrize("text, skipped", [
+    ("the budget would be cut in half", ["zh", "ja"]),
+    ("会議资料在这里", []),
+    ("会議は明日です", []),
+    ("", []),
+])
+def test_forced_languages_skipped_only_for_latin_transcripts(app_module, text, skipped):
+    scheduler = app_module.RetryScheduler(60.0, 0)
+    assert scheduler.skip_unused_languages(app_module.SCRIPT_CLASSIFIER.classify(text)) == skipped
+    assert scheduler.disabled == set(skipped)
+
+
+def test_scheduler_ranks_most_severe_first(app_module):
+    np = app_module.np
+    store = app_module.SegmentStore.from_segments([
+        {"start": 0.0, "end": 2.0, "text": "a", "avg_logprob": -0.6},
+        {"start": 2.0, "end": 4.0, "text": "b", "avg_logprob": -1.5},
+        {"start": 4.0, "end": 6.0, "text": "c", "avg_logprob": -0.6},
+    ])
+    masks = np.array([app_module.UNCLEAR_LOW_CONFIDENCE,
+                      app_module.UNCLEAR_LOW_CONFIDENCE,
+                      app_module.UNCLEAR_LOW_CONFIDENCE | app_module.UNCLEAR_TEXT_PATTERN], dtype=np.uint8)
+    scheduler = app_module.RetryScheduler(60.0, 0)
+    assert scheduler.rank(store, masks, np.arange(3)).tolist() == [1, 2, 0]
+
+
+def test_scheduler_budget_is_share_of_audio_duration(app_module):
+    scheduler = app_module.RetryScheduler(100.0, 0.5)
+    assert scheduler.has_budget()
+    scheduler.record("temperature", False, elapsed=30.0)
+    scheduler.charge(19.0)
+    assert scheduler.has_budget()
+    scheduler.charge(1.0)
+    assert not scheduler.has_budget()
+    assert app_module.RetryScheduler(100.0, 0).format_budget() == "不限制"
+
+
+def test_scheduler_disables_unsuccessful_strategy(app_module):
+    scheduler = app_module.RetryScheduler(60.0, 0, min_trials=4, min_success_rate=0.25)
+    results = [scheduler.record("zh", False) for _ in range(4)]
+    assert results == [False, False, False, True]
+    assert not scheduler.strategy_enabled("zh")
+    assert "zh" not in scheduler.ordered_strategies(len(app_module.RETRY_STRATEGIES))
+    # 成功過的策略排到前面
+    scheduler.record("beam_search", True)
+    assert scheduler.ordered_strategies(2) == ["beam_search", "temperature"]
@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.mark.parametrize("text", [
+    "写真を撮りました",
+    "机の上に本があります",
+    "今日は会議があります",
+    "この機械は新しいです",
+])
+def test_japanese_sentences_are_not_mixed(app_module, text):
+    assert not app_module.has_unnatural_mixing(text)
+    mask = app_module.score_unclear_segments([{"start": 0.0, "end": 2.0, "text": text}], -0.8)[0]
+    assert not mask & app_module.UNCLEAR_UNNATURAL_MIXING
+
+
+def test_kana_with_simplified_chinese_is_mixed(app_module):
+    assert app_module.has_unnatural_mixing("这个问题ですね")
+
+
+def test_simplified_table_excludes_joyo_kanji(app_module):
+    for char in "写机":
+        assert char not in app_module.SIMPLIFIED_ONLY_CHARS
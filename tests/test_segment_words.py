@@ -0,0 +1,102 @@
+def make_store(app_module, rows):
+    segments = []
+    for start, words in rows:
+        word_dicts = [{"word": w, "start": start + k, "end": start + k + 0.5, "probability": 0.9}
+                      for k, w in enumerate(words)]
+        segments.append({"start": start, "end": start + len(words), "text": "".join(words),
+                         "words": word_dicts})
+    return app_module.SegmentStore.from_segments(segments)
+
+
+def test_row_word_store_skips_replaced_words(app_module):
+    store = make_store(app_module, [(0.0, [" a", " b"]), (10.0, [" c", " d"])])
+    store.update(0, {"text": "x y", "words": [{"word": " x", "start": 0.0, "end": 0.4, "probability": 1.0},
+                                               {"word": " y", "start": 0.5, "end": 0.9, "probability": 1.0}]})
+    words = store.row_word_store()
+    assert words.texts() == [" x", " y", " c", " d"]
+    assert words.start.tolist() == sorted(words.start.tolist())
+
+
+def test_keep_text_spans_trims_words_and_times(app_module):
+    store = make_store(app_module, [(0.0, [" one", " two", " three", " four"])])
+    text = store.text(0)
+    store.keep_text_spans(0, [(0, text.index(" three"))])
+    assert store.text(0) == "one two"
+    assert store.row_word_store().texts() == [" one", " two"]
+    assert (store.start[0], store.end[0]) == (0.0, 1.5)
+
+
+def test_stitch_seam_cut_removes_words(app_module):
+    np = app_module.np
+    shared = [" the", " quick", " brown", " fox", " jumps"]
+    prev_store = make_store(app_module, [(0.0, [" hello", " world"] + shared)])
+    next_store = make_store(app_module, [(2.0, shared + [" over", " dogs"])])
+    prev_keep = np.ones(1, dtype=bool)
+    next_keep = np.ones(1, dtype=bool)
+    assert app_module.stitch_chunk_pair(prev_store, prev_keep, next_store, next_keep, 2.0, 7.0)
+    combined = prev_store.row_word_store().texts() + next_store.row_word_store().texts()
+    assert "".join(combined).strip() == " ".join([prev_store.text(0), next_store.text(0)]).strip()
+    # 後段被裁掉重疊部分，起訖時間改由保留的字詞決定
+    words = next_store.row_word_store()
+    assert words.texts() == [" over", " dogs"]
+    assert (next_store.start[0], next_store.end[0]) == (words.start[0], words.end[-1])
+
+
+def test_keep_text_spans_removes_middle_words(app_module):
+    store = make_store(app_module, [(0.0, [" a", " loop", " loop", " b"])])
+    text = store.text(0)
+    store.keep_text_spans(0, [(0, 2), (text.rindex(" b"), len(text))])
+    assert store.text(0) == "a b"
+    assert store.row_word_store().texts() == [" a", " b"]
+    assert (store.start[0], store.end[0]) == (0.0, 3.5)
+
+
+def test_repetition_loop_removal_drops_loop_words(app_module):
+    import types
+    loop = [f" w{k}" for k in range(5)]
+    store = make_store(app_module, [(0.0, [" start"] + loop * 4 + [" end"])])
+    fake_app = types.SimpleNamespace(log=lambda message: None)
+    result = app_module.WhisperTranscriberV5.remove_repetition_loops(fake_app, store)
+    words = result.row_word_store().texts()
+    assert "".join(words).strip() == result.text(0)
+    assert words.count(" w0") == 1
+
+
+def test_stitch_fallback_keeps_long_next_row(app_module):
+    np = app_module.np
+    prev_store = app_module.SegmentStore.from_segments(
+        [{"start": 290.0, "end": 300.0, "text": "so what we decided was"}])
+    next_store = app_module.SegmentStore.from_segments(
+        [{"start": 298.4, "end": 309.0, "text": "was that the budget would be cut in half"}])
+    prev_keep = np.ones(1, dtype=bool)
+    next_keep = np.ones(1, dtype=bool)
+    assert not app_module.stitch_chunk_pair(prev_store, prev_keep, next_store, next_keep, 298.0, 300.0)
+    assert prev_keep[0] and next_keep[0]
+    assert prev_store.text(0) == "so what we decided was"
+    assert next_store.text(0).endswith("the budget would be cut in half")
+    assert not next_store.text(0).startswith("was")
+    assert next_store.start[0] >= 300.0 and next_store.end[0] == 309.0
+
+
+def make_char_store(app_module, rows):
+    segments = []
+    for text, times in rows:
+        words = [{"word": char, "start": t, "end": t + 0.4, "probability": 0.9} for char, t in zip(text, times)]
+        segments.append({"start": times[0], "end": times[-1] + 0.4, "text": text, "words": words})
+    return app_module.SegmentStore.from_segments(segments)
+
+
+def test_stitch_match_stays_inside_overlap(app_module):
+    np = app_module.np
+    prev_text = "我們可以看到這個問題其實很複雜然後"
+    next_text = "然後我們再來討論其實很複雜的預算問題"
+    prev_times = [280.0 + k for k in range(len(prev_text) - 2)] + [298.5, 299.3]
+    next_times = [298.4, 299.1] + [300.2 + 0.5 * k for k in range(len(next_text) - 2)]
+    prev_store = make_char_store(app_module, [(prev_text, prev_times)])
+    next_store = make_char_store(app_module, [(next_text, next_times)])
+    prev_keep = np.ones(1, dtype=bool)
+    next_keep = np.ones(1, dtype=bool)
+    # 「其實很複雜」兩側都有，但不在重疊區內，不可拿來對齊
+    assert not app_module.stitch_chunk_pair(prev_store, prev_keep, next_store, next_keep, 298.0, 300.0)
+    assert prev_store.text(0) == prev_text
+    assert next_store.text(0) == "我們再來討論其實很複雜的預算問題"
@@ -0,0 +1,64 @@
+import json
+import os
+
+
+def chunk_store(app_module, start, end, step=10.0):
+    rows = []
+    t = start
+    while t < end:
+        rows.append({"start": t, "end": min(t + step, end), "text": f"row{int(t)}"})
+        t += step
+    return app_module.SegmentStore.from_segments(rows)
+
+
+def srt_starts(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.split(" --> ")[0] for line in f if " --> " in line]
+
+
+def test_rows_before_next_chunk_are_written_immediately(app_module, tmp_path):
+    base = str(tmp_path / "talk")
+    writer = app_module.StreamingTranscriptWriter(base, 2, window_seconds=10.0, overlap_seconds=2.0)
+    writer.add_chunk(1, 0.0, 60.0, chunk_store(app_module, 0.0, 60.0))
+    # 下一段從 58 秒開始：結束於 48 秒以前的片段不必等下一段
+    assert writer.written_until == 40.0
+    assert len(srt_starts(base + ".srt")) == 4
+    writer.add_chunk(2, 58.0, 100.0, chunk_store(app_module, 60.0, 100.0))
+    writer.finish()
+    assert len(srt_starts(base + ".srt")) == 10
+    with open(base + ".txt", encoding="utf-8") as f:
+        assert f.read().split() == [f"row{t}" for t in range(0, 100, 10)]
+
+
+def read_marker(base):
+    with open(base + ".partial", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_out_of_order_chunks_are_written_in_order(app_module, tmp_path):
+    base = str(tmp_path / "talk")
+    writer = app_module.StreamingTranscriptWriter(base, 3, window_seconds=0.0)
+    writer.add_chunk(3, 60.0, 90.0, chunk_store(app_module, 60.0, 90.0))
+    writer.add_chunk(2, 30.0, 60.0, chunk_store(app_module, 30.0, 60.0))
+    # 第 1 段還沒完成，後面的段不可先寫出
+    assert writer.written == 0
+    assert read_marker(base)["chunks_done"] == 2
+    writer.add_chunk(1, 0.0, 30.0, chunk_store(app_module, 0.0, 30.0))
+    writer.finish()
+    with open(base + ".txt", encoding="utf-8") as f:
+        assert f.read().split() == [f"row{t}" for t in range(0, 90, 10)]
+    assert srt_starts(base + ".srt")[0] == "00:00:00,000"
+
+
+def test_partial_marker_tracks_progress(app_module, tmp_path):
+    base = str(tmp_path / "talk")
+    writer = app_module.StreamingTranscriptWriter(base, 2, write_txt=False, window_seconds=0.0)
+    assert read_marker(base)["chunks_total"] == 2
+    writer.add_chunk(1, 0.0, 30.0, chunk_store(app_module, 0.0, 30.0))
+    marker = read_marker(base)
+    assert marker["chunks_done"] == 1 and marker["segments_written"] == 3
+    # 中途停止：寫出已完成的部分，標記檔留給呼叫端在完整結果寫出後刪除
+    writer.finish()
+    assert os.path.exists(base + ".partial")
+    assert not os.path.exists(base + ".txt")
+    assert read_marker(base)["written_until"] == 30.0